@@ -0,0 +1,16 @@
+"""Runs the bot under test, started by the load generator.
+
+The stub model is installed at import time, so the sharded webhook
+workers, which are spawned and import this module again, use it too.
+"""
+import os
+
+from benchmarks.stub_llm import install_stub_model
+from src.bot import start_bot
+
+
+install_stub_model(float(os.environ.get("BENCHMARK_LLM_LATENCY", "0.3")))
+
+
+if __name__ == "__main__":
+    start_bot()
@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Any, Callable
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.web
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "todofrog", "username": "todofrog_bot"}
+PHOTO = [{"file_id": "benchmark-photo", "file_unique_id": "benchmark-photo", "width": 800, "height": 600}]
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# matches a Bot API request of the bot, e.g. the reply a user waits for
+RequestPredicate = Callable[[str, dict[str, Any]], bool]
+
+
+def _parse_value(value: str) -> Any:
+    # the bot sends form fields, everything but plain strings is JSON encoded
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeBotApi:
+    """A local stand-in for the Telegram Bot API.
+
+    Updates of synthetic users are handed to the bot through getUpdates,
+    or posted to the webhook the bot registered. Requests of the bot
+    resolve the waiters of the chat they are sent to, and messages it
+    sends get ids from the same per chat sequence as the users' messages,
+    like they do in Telegram.
+    """
+
+    def __init__(self):
+        self.webhook_url = ""
+        self.secret_token = ""
+        self.requests: Counter[str] = Counter()
+        self.polling = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+
+        self._update_ids = itertools.count(1)
+        self._updates: list[dict] = []
+        self._has_updates = asyncio.Event()
+        self._message_ids: dict[int, itertools.count] = {}
+        self._waiters: dict[int, list[tuple[RequestPredicate, asyncio.Future]]] = {}
+        self._client = tornado.httpclient.AsyncHTTPClient()
+        self._closed = False
+
+    def next_message_id(self, chat_id: int) -> int:
+        return next(self._message_ids.setdefault(chat_id, itertools.count(1)))
+
+    def expect(self, chat_id: int, predicate: RequestPredicate) -> asyncio.Future:
+        """Returns a future of (method, params, result) of the first matching request to the chat"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, future))
+        return future
+
+    def forget(self, chat_id: int, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(chat_id, [])
+        self._waiters[chat_id] = [waiter for waiter in waiters if waiter[1] is not future]
+
+    async def deliver(self, update: dict, retry_for: float = 30.0) -> None:
+        """Hands the update to the bot, to its webhook once one is set"""
+        update = {"update_id": next(self._update_ids), **update}
+        if not self.webhook_url:
+            self._updates.append(update)
+            self._has_updates.set()
+            return
+
+        headers = {"Content-Type": "application/json"}
+        if self.secret_token:
+            headers[SECRET_TOKEN_HEADER] = self.secret_token
+        deadline = time.monotonic() + retry_for
+        while True:
+            try:
+                await self._client.fetch(self.webhook_url, method="POST", body=json.dumps(update), headers=headers)
+                return
+            except (OSError, tornado.httpclient.HTTPClientError):
+                # like Telegram, a refused or failed update is delivered again
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    def close(self) -> None:
+        """Answers pending long polls, so the server can be stopped"""
+        self._closed = True
+        self._has_updates.set()
+
+    async def get_updates(self, offset: int, limit: int, timeout: float) -> list[dict]:
+        self.polling.set()
+        if self._closed:
+            return []
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, chat_id: int, params: dict[str, Any], **fields) -> dict:
+        message = {
+            "message_id": self.next_message_id(chat_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+        if "reply_markup" in params and "inline_keyboard" in params["reply_markup"]:
+            message["reply_markup"] = params["reply_markup"]
+        return message
+
+    async def handle(self, method: str, params: dict[str, Any]) -> Any:
+        self.requests[method] += 1
+        chat_id = params.get("chat_id")
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = await self.get_updates(int(params.get("offset", 0)), int(params.get("limit", 100)), float(params.get("timeout", 0)))
+        elif method == "setWebhook":
+            self.webhook_url = params["url"]
+            self.secret_token = params.get("secret_token", "")
+            self.webhook_set.set()
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = ""
+            result = True
+        elif method == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "sendMessage":
+            result = self._message(chat_id, params, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, params, photo=PHOTO, caption=params.get("caption", ""))
+        elif method in ("editMessageCaption", "editMessageReplyMarkup", "editMessageText"):
+            result = {
+                "message_id": params["message_id"],
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "photo": PHOTO,
+                "caption": params.get("caption", ""),
+                **({"reply_markup": params["reply_markup"]} if "reply_markup" in params else {}),
+            }
+        else:
+            # deleteMessage, answerCallbackQuery and the like
+            result = True
+
+        if chat_id is not None:
+            self._resolve(int(chat_id), method, params, result)
+        elif method == "answerCallbackQuery":
+            self._resolve(int(params["callback_query_id"].split(":")[0]), method, params, result)
+        return result
+
+    def _resolve(self, chat_id: int, method: str, params: dict[str, Any], result: Any) -> None:
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for index, (predicate, future) in enumerate(waiters):
+            if predicate(method, params):
+                del waiters[index]
+                if not future.done():
+                    future.set_result((method, params, result))
+                return
+
+    def listen(self, port: int, host: str = "127.0.0.1") -> tornado.httpserver.HTTPServer:
+        server = tornado.httpserver.HTTPServer(tornado.web.Application([
+            (r"/bot([^/]+)/(\w+)", BotApiHandler, {"api": self}),
+        ]))
+        server.listen(port, host)
+        return server
+
+
+class BotApiHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotApi) -> None:
+        self.api = api
+
+    async def post(self, token: str, method: str) -> None:
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            params = {name: _parse_value(self.get_body_argument(name)) for name in self.request.body_arguments}
+        result = await self.api.handle(method, params)
+        self.write({"ok": True, "result": result})
+
+    get = post
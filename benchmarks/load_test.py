@@ -0,0 +1,374 @@
+"""Load test of the bot against a local stand-in for the Bot API and a stub LLM.
+
+Synthetic users run the real flows: /start once, then create a task,
+list the tasks, open one and complete or delete it, with random think
+times between the steps. A step's latency is measured from delivering
+its update to the bot's reply, and steps are named after the handlers
+that serve them.
+
+The bot is started with start_bot in a subprocess, in polling or
+webhook mode, against the database of DB_URL, which has to be migrated
+(alembic upgrade head). Users get ids from --user-id-offset on and their
+tasks stay in the database.
+
+    python -m benchmarks.load_test --mode polling --users 200 --duration 60
+    python -m benchmarks.load_test --mode webhook --webhook-workers 4 --json report.json
+    python -m benchmarks.load_test --baseline report.json
+"""
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+import itertools
+import json
+from math import ceil
+import os
+from pathlib import Path
+import random
+import signal
+import subprocess
+import sys
+import time
+from typing import Any
+
+from benchmarks.fake_bot_api import FakeBotApi, RequestPredicate
+from src.messages import TASK_NOT_FOUND_MESSAGE
+
+
+BOT_TOKEN = "123456:benchmark"
+CREATE_TASK_BUTTON = "✏️ Создать Задачу"
+LIST_TASKS_BUTTON = "📋 Список Задач"
+DESCRIPTION_PROMPT = "Напиши описание для своей задачи"
+DESCRIPTIONS = ["Застелить кровать", "Купить продукты", "Сходить на пробежку", "Прочитать главу книги", "Убраться дома"]
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def replied(method: str, params: dict[str, Any]) -> bool:
+    return method == "sendMessage"
+
+
+def list_sent(method: str, params: dict[str, Any]) -> bool:
+    return method == "sendPhoto"
+
+
+def list_shown(method: str, params: dict[str, Any]) -> bool:
+    # an empty list is a text message
+    return method in ("sendPhoto", "sendMessage", "editMessageCaption")
+
+
+def card_shown(method: str, params: dict[str, Any]) -> bool:
+    return method in ("sendMessage", "editMessageCaption")
+
+
+def status_changed(method: str, params: dict[str, Any]) -> bool:
+    return list_shown(method, params) or (method == "answerCallbackQuery" and params.get("text") == TASK_NOT_FOUND_MESSAGE)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, ceil(q / 100 * len(values)) - 1)]
+
+
+class LatencyStats:
+    def __init__(self, measure_from: float = 0.0):
+        # steps finished during warm-up aren't counted
+        self.measure_from = measure_from
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+
+    def record(self, step: str, seconds: float) -> None:
+        if time.monotonic() >= self.measure_from:
+            self.latencies[step].append(seconds)
+
+    def record_error(self, step: str) -> None:
+        if time.monotonic() >= self.measure_from:
+            self.errors[step] += 1
+
+    def summarize(self, seconds: float) -> dict[str, Any]:
+        steps = {}
+        for step in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[step])
+            steps[step] = {
+                "count": len(latencies),
+                "errors": self.errors[step],
+                "throughput": len(latencies) / seconds,
+                **{f"p{q}_ms": percentile(latencies, q) * 1000 for q in (50, 95, 99)},
+                "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+            }
+        completed = sum(step["count"] for step in steps.values())
+        return {
+            "seconds": seconds,
+            "steps_completed": completed,
+            "errors": sum(self.errors.values()),
+            "throughput": completed / seconds,
+            "steps": steps,
+        }
+
+
+class SyntheticUser:
+    def __init__(self, api: FakeBotApi, user_id: int, stats: LatencyStats, think_time: float, timeout: float):
+        self.api = api
+        self.user_id = user_id
+        self.stats = stats
+        self.think_time = think_time
+        self.timeout = timeout
+        self._callback_ids = itertools.count(1)
+        self._rng = random.Random(user_id)
+
+    def _user(self) -> dict:
+        return {"id": self.user_id, "is_bot": False, "first_name": "Frog", "username": f"frog{self.user_id}"}
+
+    def _message_update(self, text: str) -> dict:
+        message = {
+            "message_id": self.api.next_message_id(self.user_id),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": message}
+
+    def _callback_update(self, data: str, message: dict) -> dict:
+        return {"callback_query": {
+            # the fake API finds the user's chat by the id's prefix when the query is answered
+            "id": f"{self.user_id}:{next(self._callback_ids)}",
+            "from": self._user(),
+            "chat_instance": str(self.user_id),
+            "message": message,
+            "data": data,
+        }}
+
+    async def _step(self, step: str, update: dict, predicate: RequestPredicate) -> tuple | None:
+        """Delivers the update and waits for the matching reply, returns None if there is none in time"""
+        reply = self.api.expect(self.user_id, predicate)
+        started_at = time.perf_counter()
+        try:
+            await self.api.deliver(update)
+            result = await asyncio.wait_for(reply, self.timeout)
+        except Exception:
+            self.api.forget(self.user_id, reply)
+            self.stats.record_error(step)
+            return None
+        self.stats.record(step, time.perf_counter() - started_at)
+        return result
+
+    async def _think(self) -> None:
+        if self.think_time > 0:
+            await asyncio.sleep(self._rng.expovariate(1 / self.think_time))
+
+    async def _cycle(self) -> None:
+        reply = await self._step("create_task", self._message_update(CREATE_TASK_BUTTON), replied)
+        if reply is None:
+            return
+        # with too many tasks the conversation ends right away
+        if reply[1].get("text") == DESCRIPTION_PROMPT:
+            await self._think()
+            description = self._rng.choice(DESCRIPTIONS)
+            if await self._step("description", self._message_update(description), list_sent) is None:
+                return
+
+        await self._think()
+        reply = await self._step("get_list_tasks", self._message_update(LIST_TASKS_BUTTON), list_shown)
+        if reply is None or reply[0] != "sendPhoto":
+            return
+        list_message = reply[2]
+        buttons = [row[0]["callback_data"] for row in list_message.get("reply_markup", {}).get("inline_keyboard", [])]
+        if not buttons:
+            return
+
+        await self._think()
+        reply = await self._step(
+            "task_button_callback",
+            self._callback_update(self._rng.choice(buttons), list_message),
+            card_shown,
+        )
+        if reply is None:
+            return
+        card_message, task_id = reply[2], reply[1]["reply_markup"]["inline_keyboard"][0][0]["callback_data"].split("_")[1]
+
+        await self._think()
+        action = self._rng.choice(["complete", "delete"])
+        await self._step(
+            "change_task_status_button_callback",
+            self._callback_update(f"{action}_{task_id}", card_message),
+            status_changed,
+        )
+
+    async def run(self, start_delay: float, stop_at: float) -> None:
+        await asyncio.sleep(start_delay)
+        await self._step("start", self._message_update("/start"), replied)
+        while time.monotonic() < stop_at:
+            await self._think()
+            await self._cycle()
+
+
+def get_bot_environment(args: argparse.Namespace) -> dict[str, str]:
+    env = {
+        **os.environ,
+        "BOT_TOKEN": BOT_TOKEN,
+        "BOT_API_BASE_URL": f"http://127.0.0.1:{args.api_port}",
+        "BENCHMARK_LLM_LATENCY": str(args.llm_latency),
+        "EMOJI_BACKENDS": json.dumps(args.emoji_backends.split(",")),
+        "LOG_LEVEL": args.log_level,
+    }
+    if args.mode == "webhook":
+        # start_bot serves a webhook only outside dev mode
+        env.update({
+            "DEV_MODE": "false",
+            "USE_WEBHOOK": "true",
+            "WEBHOOK_URL": f"http://127.0.0.1:{args.port}/webhook",
+            "WEBHOOK_WORKERS": str(args.webhook_workers),
+            "PORT": str(args.port),
+        })
+        env.setdefault("DB_SSL", "false")
+    else:
+        env.update({"DEV_MODE": "true", "USE_WEBHOOK": "false"})
+    return env
+
+
+def is_ready(api: FakeBotApi, args: argparse.Namespace) -> bool:
+    if args.mode == "polling":
+        return api.polling.is_set()
+    # every application calls getMe when it starts, the receiver of sharded workers too
+    applications = args.webhook_workers + 1 if args.webhook_workers > 1 else 1
+    return api.webhook_set.is_set() and api.requests["getMe"] >= applications
+
+
+async def wait_until_ready(api: FakeBotApi, process: subprocess.Popen, args: argparse.Namespace, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not is_ready(api, args):
+        if process.poll() is not None:
+            raise RuntimeError(f"The bot exited with code {process.returncode} before it was ready")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"The bot wasn't ready in {timeout:.0f} s")
+        await asyncio.sleep(0.1)
+
+
+async def stop_bot(process: subprocess.Popen, timeout: float = 30.0) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.to_thread(process.wait, timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        await asyncio.to_thread(process.wait)
+
+
+async def run_load_test(args: argparse.Namespace) -> dict[str, Any]:
+    api = FakeBotApi()
+    server = api.listen(args.api_port)
+    log = open(args.bot_log, "ab") if args.bot_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bot_process"],
+        env=get_bot_environment(args),
+        cwd=REPO_ROOT,
+        stdout=log,
+        stderr=log,
+    )
+    try:
+        await wait_until_ready(api, process, args)
+        started_at = time.monotonic()
+        stats = LatencyStats(measure_from=started_at + args.warm_up)
+        stop_at = stats.measure_from + args.duration
+        users = [
+            SyntheticUser(api, args.user_id_offset + index, stats, args.think_time, args.timeout)
+            for index in range(args.users)
+        ]
+        await asyncio.gather(*(
+            user.run(args.ramp_up * index / args.users, stop_at)
+            for index, user in enumerate(users)
+        ))
+        # users finish their last cycle after the stop time
+        summary = stats.summarize(time.monotonic() - stats.measure_from)
+    finally:
+        await stop_bot(process)
+        api.close()
+        server.stop()
+        await server.close_all_connections()
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+    summary.update({
+        "mode": args.mode,
+        "users": args.users,
+        "webhook_workers": args.webhook_workers if args.mode == "webhook" else None,
+        "think_time": args.think_time,
+        "llm_latency": args.llm_latency,
+        "bot_api_requests": dict(api.requests),
+    })
+    return summary
+
+
+def format_report(summary: dict[str, Any]) -> str:
+    lines = [
+        f"{summary['mode']}, {summary['users']} users, {summary['seconds']:.0f} s: "
+        f"{summary['steps_completed']} steps, {summary['throughput']:.1f} steps/s, {summary['errors']} errors",
+        "",
+        f"{'step':<36}{'count':>8}{'errors':>8}{'per s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for step, stats in summary["steps"].items():
+        lines.append(
+            f"{step:<36}{stats['count']:>8}{stats['errors']:>8}{stats['throughput']:>8.1f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+    requests = ", ".join(f"{method} {count}" for method, count in sorted(summary["bot_api_requests"].items()))
+    lines += ["", f"Bot API requests: {requests}"]
+    return "\n".join(lines)
+
+
+def find_regressions(summary: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Steps whose p95 grew by more than the tolerance, or that started failing"""
+    regressions = []
+    for step, stats in summary["steps"].items():
+        before = baseline["steps"].get(step)
+        if before is None:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {before['p95_ms']:.1f} ms -> {stats['p95_ms']:.1f} ms")
+        if stats["errors"] > before["errors"]:
+            regressions.append(f"{step}: errors {before['errors']} -> {stats['errors']}")
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test of the bot against a local fake Bot API")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between a user's steps, 0 for none")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds measured after the warm-up")
+    parser.add_argument("--warm-up", type=float, default=10.0, help="seconds not measured, users start during them")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds a user waits for a reply")
+    parser.add_argument("--webhook-workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8080, help="webhook port of the bot")
+    parser.add_argument("--api-port", type=int, default=8999, help="port of the fake Bot API")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="mean seconds of a stub LLM request")
+    parser.add_argument("--emoji-backends", default="yandexgpt", help="comma separated emoji backends of the bot")
+    parser.add_argument("--user-id-offset", type=int, default=2_000_000_000, help="telegram id of the first user, ids are int4 columns")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the bot")
+    parser.add_argument("--bot-log", help="file the bot's output is appended to, discarded by default")
+    parser.add_argument("--json", help="file the report is written to")
+    parser.add_argument("--baseline", help="report to compare with, exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    summary = asyncio.run(run_load_test(args))
+    print(format_report(summary))
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2))
+
+    if args.baseline:
+        regressions = find_regressions(summary, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:\n" + "\n".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from src.llm_service import GENERATE_EMOJIS_BATCH_PROMPT, YandexGPTBackend
+
+
+EMOJIS = ["🐸", "🛏", "🧘", "📚", "🧹", "🛒", "💻", "🏃"]
+
+
+class StubModel:
+    """Answers like the YandexGPT completions model after a simulated latency"""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.5):
+        self.latency = latency
+        self.jitter = jitter
+
+    async def run(self, messages: list[dict]):
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        descriptions = messages[-1]["text"].splitlines()
+        if messages[0] is GENERATE_EMOJIS_BATCH_PROMPT:
+            text = "\n".join(f"{i}. {self._emoji(line)}" for i, line in enumerate(descriptions, start=1))
+        else:
+            text = self._emoji(messages[-1]["text"])
+        return SimpleNamespace(alternatives=[SimpleNamespace(text=text)])
+
+    @staticmethod
+    def _emoji(description: str) -> str:
+        return EMOJIS[hash(description) % len(EMOJIS)]
+
+
+def install_stub_model(latency: float) -> None:
+    """Makes every YandexGPT backend use the stub instead of the SDK client"""
+    model = StubModel(latency)
+    YandexGPTBackend.model = property(lambda self: model, YandexGPTBackend.model.fset)
@@ -1,5 +1,4 @@
 from src.bot import start_bot
-from src.llm_service import llm_service
 
 if __name__ == "__main__":
     start_bot()
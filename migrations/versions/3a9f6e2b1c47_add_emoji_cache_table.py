@@ -0,0 +1,37 @@
+"""add emoji cache table
+
+Revision ID: 3a9f6e2b1c47
+Revises: b7e4d1c06a92
+Create Date: 2025-02-10 21:48:33.912046
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a9f6e2b1c47'
+down_revision: Union[str, None] = 'b7e4d1c06a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'emoji_cache',
+        sa.Column('description_key', sa.Text(), nullable=False),
+        sa.Column('emoji', sa.String(length=8), nullable=False),
+        sa.Column(
+            'created_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('CURRENT_TIMESTAMP'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('description_key'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('emoji_cache')
@@ -0,0 +1,33 @@
+"""add partial index for pending tasks lookups
+
+Revision ID: 5f1c2a9d8e34
+Revises: 9ccbc837bc15
+Create Date: 2025-02-08 14:32:11.204517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2a9d8e34'
+down_revision: Union[str, None] = '9ccbc837bc15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # completed tasks are never read by user_id again, so only pending rows are indexed
+    op.create_index(
+        'ix_tasks_user_id_pending',
+        'tasks',
+        ['user_id'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_user_id_pending', table_name='tasks')
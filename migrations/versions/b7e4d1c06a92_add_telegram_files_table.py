@@ -0,0 +1,37 @@
+"""add telegram files table
+
+Revision ID: b7e4d1c06a92
+Revises: 5f1c2a9d8e34
+Create Date: 2025-02-09 11:05:47.618203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4d1c06a92'
+down_revision: Union[str, None] = '5f1c2a9d8e34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'telegram_files',
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('file_id', sa.String(length=255), nullable=False),
+        sa.Column(
+            'updated_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('CURRENT_TIMESTAMP'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('telegram_files')
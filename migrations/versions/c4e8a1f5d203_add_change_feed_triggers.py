@@ -0,0 +1,55 @@
+"""add change feed triggers
+
+Revision ID: c4e8a1f5d203
+Revises: 3a9f6e2b1c47
+Create Date: 2025-02-14 18:22:07.519384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f5d203'
+down_revision: Union[str, None] = '3a9f6e2b1c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the trigger argument names the column with the user's telegram id,
+    # notifications are delivered on commit and identical ones are sent once per transaction;
+    # users rows aren't cached anywhere, so their hot write paths don't notify
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_user_change()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            row_data jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data = to_jsonb(OLD);
+            ELSE
+                row_data = to_jsonb(NEW);
+            END IF;
+            PERFORM pg_notify(
+                'todofrog_changes',
+                json_build_object('table', TG_TABLE_NAME, 'user_id', (row_data ->> TG_ARGV[0])::bigint)::text
+            );
+            RETURN NULL;
+        END;
+        $$ language 'plpgsql';
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE TRIGGER notify_tasks_change
+            AFTER INSERT OR UPDATE OR DELETE ON tasks
+            FOR EACH ROW
+            EXECUTE FUNCTION notify_user_change('user_id');
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS notify_tasks_change ON tasks;")
+    op.execute("DROP FUNCTION IF EXISTS notify_user_change();")
@@ -0,0 +1,42 @@
+"""add task rollover
+
+Revision ID: e2b7c9d4a618
+Revises: c4e8a1f5d203
+Create Date: 2025-02-16 23:05:41.278613
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c9d4a618'
+down_revision: Union[str, None] = 'c4e8a1f5d203'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # a constant default doesn't rewrite the table
+    op.add_column('tasks', sa.Column('jumps', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_table(
+        'task_rollovers',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('last_task_id', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('jumped_tasks', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column(
+            'started_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('CURRENT_TIMESTAMP'),
+            nullable=False,
+        ),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('day'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('task_rollovers')
+    op.drop_column('tasks', 'jumps')
@@ -0,0 +1,44 @@
+"""add reminder broadcasts
+
+Revision ID: f9a3d5e1b274
+Revises: e2b7c9d4a618
+Create Date: 2025-02-19 08:41:12.663021
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f9a3d5e1b274'
+down_revision: Union[str, None] = 'e2b7c9d4a618'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('blocked_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table(
+        'reminder_broadcasts',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('last_user_id', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('sent', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('blocked', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('failed', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column(
+            'started_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('CURRENT_TIMESTAMP'),
+            nullable=False,
+        ),
+        sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('day'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('reminder_broadcasts')
+    op.drop_column('users', 'blocked_at')
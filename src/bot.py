@@ -1,9 +1,10 @@
 from enum import Enum
-from importlib.resources import files
+import functools
 import os
-from pathlib import Path
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, ReplyKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, Update, ReplyKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -14,23 +15,37 @@ from telegram.ext import (
     filters,
 )
 
-from src.database import get_session
+from src.database import get_engine, get_pool_usage, get_session, get_update_session, release_connection
 from src.settings import get_settings
 from src.models.user import User
-from src.utils import delete_message
+from src.models.task import Task
+from src.utils import SideEffects, delete_message, edit_caption_in_place
 from src.messages import (
     START_MESSAGE,
     TASK_REPLY_MESSAGE,
+    TASK_JUMPS_MARKER,
     ALL_TASKS_COMPLETED_MESSAGE,
     NO_TASKS_FOUND_MESSAGE,
+    TASK_NOT_FOUND_MESSAGE,
     TOO_MANY_TASKS_MESSAGE,
 )
-from src.user_manager import update_user_list_message_id
-from src.task_manager import TaskManager
-from src.logger import logger
+from src.user_manager import clear_list_message_id, get_list_message_id, list_message_ids, update_user_list_message_id
+from src.media_manager import TASK_LIST_IMAGE_NAME, load_asset, send_cached_photo
+from src.task_manager import PLACEHOLDER_EMOJI, TaskManager
+from src.task_cache import task_cache
+from src.change_feed import change_feed
+from src.rollover import schedule_frog_jump
+from src.broadcast import schedule_morning_reminders, stop_morning_reminders
+from src.persistence import PostgresPersistence
+from src.logger import log_handler, logger
+from src.metrics import REGISTRY, Gauge, observe_handler, start_metrics_server
+from src.rate_limiter import OutboundScheduler
+from src.update_processor import PerUserUpdateProcessor
 
 
-TASK_LIST_IMAGE: bytes = Path(files("assets").joinpath("tasks_list.jpg")).read_bytes()
+# serves the metrics while the application runs
+_metrics_server = None
+
 
 class CreateTaskConversation(Enum):
     FAILED = 0
@@ -51,17 +66,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def create_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logger.debug(f"Creating task for user {update.effective_user.id}")
-    async with get_session() as session:
-        task_manager = TaskManager(session)
-        if await task_manager.get_task_count(update.message.from_user.id) >= 5:
-            logger.debug(f"User {update.message.from_user.id} has too many tasks. Creating task skipped")
-            await update.message.reply_text(TOO_MANY_TASKS_MESSAGE, parse_mode="Markdown")
-            return ConversationHandler.END
-        else:
-            logger.debug(f"Waining for task description for user {update.message.from_user.id}")
-            await update.message.reply_text("Напиши описание для своей задачи")
-            return CreateTaskConversation.DESCRIPTION
+    logger.debug("Creating task for user %d", update.effective_user.id)
+    async with get_update_session(context) as session:
+        task_count = await TaskManager(session).get_task_count(update.message.from_user.id)
+
+    if task_count >= 5:
+        logger.debug("User %d has too many tasks. Creating task skipped", update.message.from_user.id)
+        await update.message.reply_text(TOO_MANY_TASKS_MESSAGE, parse_mode="Markdown")
+        return ConversationHandler.END
+    else:
+        logger.debug("Waining for task description for user %d", update.message.from_user.id)
+        await update.message.reply_text("Напиши описание для своей задачи")
+        return CreateTaskConversation.DESCRIPTION
         
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -75,20 +91,84 @@ async def silent_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 
 async def description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    async with get_session() as session:
-        logger.debug(f"Creating task for user %d", update.message.from_user.id)
+    in_background = get_settings().generate_emoji_in_background
+    async with get_update_session(context) as session:
+        logger.debug("Creating task for user %d", update.message.from_user.id)
         task_manager = TaskManager(session)
-        await task_manager.create_task(
+        task_id = await task_manager.create_task(
             user_id=update.message.from_user.id,
             username=update.message.from_user.username,
             description=update.message.text,
+            emoji=PLACEHOLDER_EMOJI if in_background else None,
         )
 
-        logger.debug(f"Successfully created task for user {update.message.from_user.id}")
+        logger.debug("Successfully created task for user %d", update.message.from_user.id)
+        await release_connection(session)
         await update.message.reply_text("Задача создана! 👋")
-        await get_list_tasks(update, context, disable_delete=True, message_id_offset=1)
+        list_message = await get_list_tasks(update, context, disable_delete=True, message_id_offset=1)
+
+    # scheduled after the update is committed, so the job always sees the task
+    if in_background:
+        context.application.create_task(
+            fill_task_emoji(
+                context,
+                chat_id=update.effective_chat.id,
+                user_id=update.message.from_user.id,
+                task_id=task_id,
+                description=update.message.text,
+                list_message_id=list_message.message_id if list_message else None,
+            ),
+            update=update,
+        )
 
-        return ConversationHandler.END
+    return ConversationHandler.END
+
+
+async def fill_task_emoji(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    user_id: int,
+    task_id: int,
+    description: str,
+    list_message_id: int | None,
+) -> None:
+    """Replaces the placeholder emoji of a created task and refreshes the already shown list"""
+    async with get_session() as session:
+        task_manager = TaskManager(session)
+        await task_manager.fill_task_emoji(task_id, description)
+        tasks = await task_manager.get_pending_user_tasks(user_id)
+        user = await session.get(User, user_id)
+
+    if not list_message_id or not tasks:
+        return
+    if get_list_message_id(user) != list_message_id:
+        # a newer list was shown meanwhile; an edited message may no longer be the list at all
+        logger.debug("List message %d of user %d is outdated, not refreshing it", list_message_id, user_id)
+        return
+
+    try:
+        await context.bot.edit_message_reply_markup(
+            chat_id,
+            list_message_id,
+            reply_markup=build_tasks_keyboard(tasks),
+        )
+    except BadRequest as e:
+        # the list was replaced or deleted in the meantime
+        logger.debug("Failed to refresh list message %d: %s", list_message_id, e)
+
+
+def task_button_text(task: Task) -> str:
+    text = task.emoji + " " + task.description
+    if task.jumps:
+        text += " " + TASK_JUMPS_MARKER.format(jumps=task.jumps)
+    return text
+
+
+def build_tasks_keyboard(tasks: list[Task]) -> InlineKeyboardMarkup:
+    keyboard = []
+    for task in tasks:
+        keyboard.append([InlineKeyboardButton(task_button_text(task), callback_data=str(task.id))])
+    return InlineKeyboardMarkup(keyboard)
     
 
 async def get_list_tasks(
@@ -96,47 +176,94 @@ async def get_list_tasks(
     context: ContextTypes.DEFAULT_TYPE,
     disable_delete: bool = False,
     message_id_offset: int = 0,
-) -> None:
+    tasks: list[Task] | None = None,
+) -> Message | None:
     user_id = update.effective_user.id
     message_id = update.effective_message.message_id
-    async with get_session() as session:
-        task_manager = TaskManager(session)
-        tasks = await task_manager.get_pending_user_tasks(user_id)
+    async with get_update_session(context) as session:
+        if tasks is None:
+            task_manager = TaskManager(session)
+            tasks = await task_manager.get_pending_user_tasks(user_id)
+        user = await session.get(User, user_id)
+        await release_connection(session)
+
+        if update.callback_query and get_settings().edit_list_in_place:
+            list_message = await show_list_in_place(update, context, session, user, tasks)
+            if list_message:
+                return list_message
         
         if not tasks:
             await update.message.reply_text(NO_TASKS_FOUND_MESSAGE)
-            return
+            return None
         
         logger.debug("Found %d for user %d", len(tasks), user_id)
 
-        keyboard = []
-        for task in tasks:
-            keyboard.append([InlineKeyboardButton(task.emoji + " " + task.description, callback_data=str(task.id))])
-            
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.send_photo(
-            update.effective_chat.id,
-            TASK_LIST_IMAGE,
-            reply_markup=reply_markup
-        )
-        
-        if not disable_delete:
-            await delete_message(update, context, message_id)
-
-        user = await session.get(User, user_id)
-        if user and user.list_message_id and user.list_message_id != message_id:
-            logger.debug("Deleting last list message %d for user %d", user.list_message_id, user_id)
-            await delete_message(update, context, user.list_message_id)
+        chat_id = update.effective_chat.id
+        async with SideEffects() as effects:
+            sent_list = effects.add(
+                send_cached_photo(
+                    session,
+                    context,
+                    chat_id,
+                    TASK_LIST_IMAGE_NAME,
+                    load_asset(TASK_LIST_IMAGE_NAME),
+                    reply_markup=build_tasks_keyboard(tasks),
+                ),
+                key=chat_id,
+                name="send list",
+            )
+
+            if not disable_delete:
+                effects.add(delete_message(update, context, message_id), name="delete command message")
+
+            last_list_message_id = get_list_message_id(user)
+            if last_list_message_id and last_list_message_id != message_id:
+                logger.debug("Deleting last list message %d for user %d", last_list_message_id, user_id)
+                # keyed by chat, so the old list is removed only once the new one is shown
+                effects.add(delete_message(update, context, last_list_message_id), key=chat_id, name="delete old list")
+        list_message = sent_list.result()
 
         # +1 because we delete the message after user sending
         # and may add more if command called from another command
         # in this case message id will be previous bot message
         await update_user_list_message_id(session, user, user_id, message_id + message_id_offset + 1)
 
+    return list_message
+
+
+async def show_list_in_place(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    session: AsyncSession,
+    user: User | None,
+    tasks: list[Task],
+) -> Message | None:
+    """Turns the pressed message back into the task list, returns None if it can't be edited"""
+    user_id = update.effective_user.id
+    message = update.callback_query.message
+    if tasks:
+        edited = await edit_caption_in_place(
+            context,
+            update.effective_chat.id,
+            message.message_id,
+            reply_markup=build_tasks_keyboard(tasks),
+        )
+    else:
+        edited = await edit_caption_in_place(
+            context,
+            update.effective_chat.id,
+            message.message_id,
+            caption=NO_TASKS_FOUND_MESSAGE,
+        )
+    if not edited:
+        return None
+
+    await update_user_list_message_id(session, user, user_id, message.message_id)
+    return message
+
 
 async def task_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
     task_id = int(query.data)
     logger.debug("Pressed task button for task %d", task_id)
 
@@ -148,81 +275,207 @@ async def task_button_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_list")],
     ]
 
-    async with get_session() as session:
-        task = await TaskManager(session).get_task(task_id)
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=TASK_REPLY_MESSAGE.format(description=task.description),
+    async with SideEffects() as effects:
+        effects.add(query.answer(), name="answer callback query")
+
+        async with get_update_session(context) as session:
+            task = await TaskManager(session).get_task(task_id)
+            # the commit at the end of the block expires the task
+            description = task.description
+
+        # the list photo becomes the task card, so going back needs no new message either
+        if get_settings().edit_list_in_place and await edit_caption_in_place(
+            context,
+            update.effective_chat.id,
+            query.message.message_id,
+            caption=TASK_REPLY_MESSAGE.format(description=description),
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown",
-        )
+        ):
+            # no list is shown anymore, so fill_task_emoji must not put one back on the card
+            clear_list_message_id(update.effective_user.id)
+            return
 
-    await delete_message(update, context, query.message.message_id)
+        chat_id = update.effective_chat.id
+        effects.add(
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=TASK_REPLY_MESSAGE.format(description=description),
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode="Markdown",
+            ),
+            key=chat_id,
+            name="send task card",
+        )
+        effects.add(delete_message(update, context, query.message.message_id), key=chat_id, name="delete list")
 
 
 async def back_to_list_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
-    await get_list_tasks(update, context)
+    async with SideEffects() as effects:
+        effects.add(query.answer(), name="answer callback query")
+        await get_list_tasks(update, context)
 
 
 async def change_task_status_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     action, task_id = query.data.split("_")
 
-    task_count = 0
-    async with get_session() as session:
+    async with get_update_session(context) as session, SideEffects() as effects:
         task_manager = TaskManager(session)
-        await task_manager.change_task_status(int(task_id), action)
-        task_count = await task_manager.get_task_count(update.effective_user.id)
-
-    if task_count > 0:
-        await query.answer("Задача выполнена, так держать!")
-        await back_to_list_button_callback(update, context)
-    else:
-        await context.bot.send_message(
+        tasks = await task_manager.change_task_status(int(task_id), action, update.effective_user.id)
+        await release_connection(session)
+
+        if tasks is None:
+            effects.add(query.answer(TASK_NOT_FOUND_MESSAGE), name="answer callback query")
+        elif tasks:
+            effects.add(query.answer("Задача выполнена, так держать!"), name="answer callback query")
+            # remaining tasks come back with the status change, so the list is rendered without another query
+            await get_list_tasks(update, context, tasks=tasks)
+        elif not (get_settings().edit_list_in_place and await edit_caption_in_place(
+            context,
             update.effective_chat.id,
-            ALL_TASKS_COMPLETED_MESSAGE,
-            parse_mode="Markdown"
-        )
-        await delete_message(update, context, query.message.message_id)
-
+            query.message.message_id,
+            caption=ALL_TASKS_COMPLETED_MESSAGE,
+            parse_mode="Markdown",
+        )):
+            chat_id = update.effective_chat.id
+            effects.add(
+                context.bot.send_message(
+                    chat_id,
+                    ALL_TASKS_COMPLETED_MESSAGE,
+                    parse_mode="Markdown"
+                ),
+                key=chat_id,
+                name="send all tasks completed",
+            )
+            effects.add(delete_message(update, context, query.message.message_id), key=chat_id, name="delete task card")
+
+
+def instrument(callback):
+    """Wraps a handler with its log context and metrics"""
+    return observe_handler(log_handler(callback))
+
+
+async def on_startup(app: Application, metrics_port: int = 0) -> None:
+    global _metrics_server
+    if metrics_port:
+        _metrics_server = start_metrics_server(metrics_port, get_settings().metrics_host)
+    list_message_ids.start(get_settings().list_message_id_flush_interval)
+    if get_settings().use_change_feed:
+        # other replicas change tasks of users this process has cached
+        change_feed.subscribe("tasks", task_cache.invalidate, task_cache.clear)
+        change_feed.start()
+
+
+async def on_stop(app: Application) -> None:
+    # the bot is still initialized here, so in-flight reminders finish or stay unsent
+    await stop_morning_reminders()
+
+
+async def on_shutdown(app: Application) -> None:
+    global _metrics_server
+    await change_feed.stop()
+    await list_message_ids.stop()
+    if _metrics_server is not None:
+        _metrics_server.stop()
+        _metrics_server = None
+
+
+def build_application(with_updater: bool = True, schedule_jobs: bool = True, metrics_port: int | None = None) -> Application:
+    """Builds the bot application with all handlers registered.
+
+    Args:
+        with_updater (bool): False for webhook workers, which get updates from the receiver
+        schedule_jobs (bool): Whether this process runs the daily jobs
+        metrics_port (int | None): Port of the metrics endpoint, settings.metrics_port by default, 0 disables it
+    """
+    if metrics_port is None:
+        metrics_port = get_settings().metrics_port
+    scheduler = OutboundScheduler(
+        global_rate=get_settings().rate_limit_global_per_second,
+        chat_rate=get_settings().rate_limit_chat_per_second,
+        chat_burst=get_settings().rate_limit_chat_burst,
+        max_retries=get_settings().rate_limit_max_retries,
+    )
+    REGISTRY.register(Gauge(
+        "todofrog_telegram_queue_depth", "Bot API requests waiting for the rate limiter", ("priority",),
+        function=scheduler.queue_depths,
+    ))
 
-def start_bot():
-    app = Application.builder().token(get_settings().bot_token) \
+    builder = Application.builder().token(get_settings().bot_token) \
         .get_updates_read_timeout(10.0) \
         .get_updates_write_timeout(10.0) \
         .get_updates_pool_timeout(30.0) \
         .get_updates_connection_pool_size(50) \
-        .concurrent_updates(5) \
-        .build()
+        .concurrent_updates(PerUserUpdateProcessor(
+            max_concurrent_updates=get_settings().max_concurrent_updates,
+            min_concurrent_updates=get_settings().min_concurrent_updates,
+            adapt_interval=1.0 if get_settings().adaptive_concurrency else None,
+            max_loop_lag=get_settings().max_event_loop_lag,
+            get_pool_usage=get_pool_usage,
+        )) \
+        .rate_limiter(scheduler) \
+        .persistence(PostgresPersistence(update_interval=get_settings().persistence_update_interval)) \
+        .post_init(functools.partial(on_startup, metrics_port=metrics_port)) \
+        .post_stop(on_stop) \
+        .post_shutdown(on_shutdown)
+    if get_settings().bot_api_base_url:
+        urls = get_settings().bot_api_urls
+        builder = builder.base_url(urls["base_url"]).base_file_url(urls["base_file_url"])
+    if not with_updater:
+        builder = builder.updater(None)
+    app = builder.build()
+
+    if schedule_jobs:
+        schedule_frog_jump(app.job_queue)
+        schedule_morning_reminders(app.job_queue)
 
     conv_handler = ConversationHandler(
         entry_points=[
-            CommandHandler('create_task', create_task),
-            MessageHandler(filters.Regex(r"^✏️ Создать Задачу$"), create_task),
+            CommandHandler('create_task', instrument(create_task)),
+            MessageHandler(filters.Regex(r"^✏️ Создать Задачу$"), instrument(create_task)),
         ],
         states={
             CreateTaskConversation.DESCRIPTION: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, description)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, instrument(description))
             ],
         },
         fallbacks=[
-            CommandHandler('cancel', cancel),
+            CommandHandler('cancel', instrument(cancel)),
         ],
+        # survives restarts and rolling deploys
+        name="create_task",
+        persistent=True,
     )
 
-    app.add_handler(CommandHandler('start', start))
-    app.add_handler(CommandHandler('list_tasks', get_list_tasks))
+    app.add_handler(CommandHandler('start', instrument(start)))
+    app.add_handler(CommandHandler('list_tasks', instrument(get_list_tasks)))
 
-    app.add_handler(MessageHandler(filters.Regex(r"^📋 Список Задач$"), get_list_tasks))
+    app.add_handler(MessageHandler(filters.Regex(r"^📋 Список Задач$"), instrument(get_list_tasks)))
 
-    app.add_handler(CallbackQueryHandler(task_button_callback, pattern="^[0-9]+$"))
-    app.add_handler(CallbackQueryHandler(back_to_list_button_callback, pattern="^back_to_list$"))
-    app.add_handler(CallbackQueryHandler(change_task_status_button_callback, pattern="^(complete|delete)_[0-9]+$"))
+    app.add_handler(CallbackQueryHandler(instrument(task_button_callback), pattern="^[0-9]+$"))
+    app.add_handler(CallbackQueryHandler(instrument(back_to_list_button_callback), pattern="^back_to_list$"))
+    app.add_handler(CallbackQueryHandler(instrument(change_task_status_button_callback), pattern="^(complete|delete)_[0-9]+$"))
 
     app.add_handler(conv_handler)
 
+    return app
+
+
+def start_bot():
+    if not get_settings().dev_mode and get_settings().use_webhook and get_settings().webhook_workers > 1:
+        # the receiver only routes updates, the workers build their own applications
+        from src.webhook import run_sharded_webhook
+        run_sharded_webhook()
+        return
+
+    # heavy resources are created here rather than at import time
+    get_engine()
+    load_asset(TASK_LIST_IMAGE_NAME)
+
+    app = build_application()
+
     if not get_settings().dev_mode and get_settings().use_webhook:
         port = os.environ.get("PORT", 8080)
         logger.info("Running bot with webhook on port %s...", port)
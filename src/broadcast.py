@@ -0,0 +1,300 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import date, datetime, time as day_time, timedelta
+import time
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import func, select, update
+from telegram import Bot
+from telegram.error import Forbidden
+from telegram.ext import ContextTypes, JobQueue
+
+from src.database import get_session
+from src.messages import MORNING_REMINDER_MESSAGE
+from src.models.reminder_broadcast import ReminderBroadcast
+from src.models.user import User
+from src.rate_limiter import Priority, TokenBucket
+from src.settings import get_settings
+from src.logger import logger
+
+
+@dataclass
+class BroadcastReport:
+    day: date
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+class ReminderBroadcaster:
+    """Sends the day's morning reminder to every user who hasn't blocked the bot.
+
+    User ids are read in segments through a server-side cursor, so
+    neither the whole user list nor a long transaction is held, and
+    sharded by id between workers. Workers send through the bot's rate
+    limiter with the broadcast priority, and the broadcast as a whole is
+    capped below the global limit, so replies to users keep their share.
+
+    Progress is checkpointed below the smallest user id still in flight,
+    so a restart resumes from there and repeats at most the reminders
+    that were in flight. Users who blocked the bot are recorded and
+    skipped by later broadcasts. A run claims the day for a lease that
+    every checkpoint renews, so replicas don't send the same reminders.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        day: date,
+        workers: int = 8,
+        rate: float = 20.0,
+        segment_size: int = 5000,
+        checkpoint_interval: float = 5.0,
+        lease: float = 30.0,
+        text: str = MORNING_REMINDER_MESSAGE,
+    ):
+        self.bot = bot
+        self.day = day
+        self.segment_size = segment_size
+        self.checkpoint_interval = checkpoint_interval
+        self.lease = timedelta(seconds=lease)
+        self.text = text
+
+        self._bucket = TokenBucket(rate, rate)
+        self._queues: list[asyncio.Queue[int]] = [asyncio.Queue(maxsize=segment_size) for _ in range(workers)]
+        # ids handed to each worker and not sent yet, in the order they are sent
+        self._in_flight: list[deque[int]] = [deque() for _ in range(workers)]
+        self._last_read = 0
+
+        # not checkpointed yet
+        self._sent = 0
+        self._blocked = 0
+        self._failed = 0
+        self._blocked_ids: list[int] = []
+
+        self.report = BroadcastReport(day)
+
+    def _done_up_to(self) -> int:
+        """Every user id up to the returned one has been handled"""
+        heads = [in_flight[0] for in_flight in self._in_flight if in_flight]
+        return min(heads) - 1 if heads else self._last_read
+
+    async def _claim(self, resume_only: bool) -> bool:
+        async with get_session() as session:
+            if not resume_only:
+                await session.execute(
+                    insert(ReminderBroadcast)
+                    .values(day=self.day)
+                    .on_conflict_do_nothing(index_elements=["day"])
+                )
+            last_user_id = await session.scalar(
+                update(ReminderBroadcast)
+                .where(ReminderBroadcast.day == self.day)
+                .where(ReminderBroadcast.finished_at.is_(None))
+                .where(or_(
+                    ReminderBroadcast.claimed_until.is_(None),
+                    ReminderBroadcast.claimed_until < func.now(),
+                ))
+                .values(claimed_until=func.now() + self.lease)
+                .returning(ReminderBroadcast.last_user_id)
+            )
+            await session.commit()
+
+        if last_user_id is None:
+            return False
+        self._last_read = last_user_id
+        return True
+
+    async def _save_checkpoint(self, finished: bool = False, release: bool = False) -> None:
+        sent, blocked, failed, blocked_ids = self._sent, self._blocked, self._failed, self._blocked_ids
+        self._sent = self._blocked = self._failed = 0
+        self._blocked_ids = []
+
+        values = {
+            "last_user_id": self._done_up_to(),
+            "sent": ReminderBroadcast.sent + sent,
+            "blocked": ReminderBroadcast.blocked + blocked,
+            "failed": ReminderBroadcast.failed + failed,
+            "claimed_until": None if release else func.now() + self.lease,
+        }
+        if finished:
+            values["finished_at"] = func.now()
+        committed = False
+        try:
+            async with get_session() as session:
+                if blocked_ids:
+                    await session.execute(
+                        update(User)
+                        .where(User.telegram_id.in_(blocked_ids))
+                        .values(blocked_at=func.now())
+                    )
+                await session.execute(
+                    update(ReminderBroadcast)
+                    .where(ReminderBroadcast.day == self.day)
+                    .values(**values)
+                )
+                await session.commit()
+                committed = True
+        except BaseException:
+            # a periodic checkpoint is also cancelled mid-write when the run ends,
+            # its counts must then go into the final one
+            if not committed:
+                self._sent += sent
+                self._blocked += blocked
+                self._failed += failed
+                self._blocked_ids.extend(blocked_ids)
+            raise
+
+    async def _checkpoint_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self._save_checkpoint()
+            except Exception as e:
+                logger.error("Failed to checkpoint the reminder broadcast: %s", e)
+
+    async def _read_segment(self) -> list[int]:
+        async with get_session() as session:
+            result = await session.stream_scalars(
+                select(User.telegram_id)
+                .where(User.telegram_id > self._last_read)
+                .where(User.blocked_at.is_(None))
+                .order_by(User.telegram_id)
+                .limit(self.segment_size)
+                .execution_options(yield_per=1000)
+            )
+            return [user_id async for user_id in result]
+
+    async def _send(self, user_id: int) -> None:
+        while (delay := self._bucket.delay()) > 0:
+            await asyncio.sleep(delay)
+        self._bucket.take()
+
+        try:
+            await self.bot.send_message(
+                user_id,
+                self.text,
+                parse_mode="Markdown",
+                rate_limit_args=Priority.BROADCAST,
+            )
+        except Forbidden as e:
+            logger.debug("User %d blocked the bot: %s", user_id, e)
+            self._blocked += 1
+            self.report.blocked += 1
+            self._blocked_ids.append(user_id)
+        except Exception as e:
+            logger.warning("Failed to send the reminder to user %d: %s", user_id, e)
+            self._failed += 1
+            self.report.failed += 1
+        else:
+            self._sent += 1
+            self.report.sent += 1
+
+    async def _work(self, shard: int) -> None:
+        queue = self._queues[shard]
+        while True:
+            user_id = await queue.get()
+            # a cancelled send stays in flight, so it's repeated on resume
+            await self._send(user_id)
+            self._in_flight[shard].popleft()
+            queue.task_done()
+
+    async def run(self, resume_only: bool = False) -> BroadcastReport | None:
+        """Sends the broadcast, returns None if it's finished or claimed by another run.
+
+        With resume_only an unfinished broadcast is continued, but no new one is started.
+        """
+        if not await self._claim(resume_only):
+            return None
+
+        started_at = time.monotonic()
+        workers = [asyncio.create_task(self._work(shard)) for shard in range(len(self._queues))]
+        checkpointer = asyncio.create_task(self._checkpoint_periodically())
+        finished = False
+        try:
+            while segment := await self._read_segment():
+                for user_id in segment:
+                    shard = user_id % len(self._queues)
+                    self._in_flight[shard].append(user_id)
+                    await self._queues[shard].put(user_id)
+                    self._last_read = user_id
+            for queue in self._queues:
+                await queue.join()
+            finished = True
+        finally:
+            for task in [checkpointer, *workers]:
+                task.cancel()
+            await asyncio.gather(checkpointer, *workers, return_exceptions=True)
+            await self._save_checkpoint(finished=finished, release=True)
+
+        self.report.seconds = time.monotonic() - started_at
+        logger.info(
+            "Morning reminder for %s: %d sent, %d blocked, %d failed in %.2f s",
+            self.day, self.report.sent, self.report.blocked, self.report.failed, self.report.seconds,
+        )
+        return self.report
+
+
+# the running broadcast, it isn't awaited by its job, so it doesn't hold up the job queue's shutdown
+_broadcast: asyncio.Task | None = None
+
+
+async def _broadcast_morning_reminders(bot: Bot, resume_only: bool) -> None:
+    settings = get_settings()
+    broadcaster = ReminderBroadcaster(
+        bot,
+        datetime.now(ZoneInfo(settings.timezone)).date(),
+        workers=settings.broadcast_workers,
+        rate=settings.broadcast_rate,
+        segment_size=settings.broadcast_segment_size,
+        checkpoint_interval=settings.broadcast_checkpoint_interval,
+        lease=settings.broadcast_lease,
+    )
+    try:
+        await broadcaster.run(resume_only=resume_only)
+    except asyncio.CancelledError:
+        logger.info("Morning reminder stopped, it is resumed on restart")
+        raise
+    except Exception as e:
+        logger.error("Morning reminder failed, it is resumed on restart: %s", e)
+
+
+def _start_broadcast(context: ContextTypes.DEFAULT_TYPE, resume_only: bool) -> None:
+    global _broadcast
+    if _broadcast is not None and not _broadcast.done():
+        logger.warning("Morning reminder is still running, not starting another one")
+        return
+    _broadcast = asyncio.create_task(_broadcast_morning_reminders(context.bot, resume_only))
+
+
+async def send_morning_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    _start_broadcast(context, resume_only=False)
+
+
+async def resume_morning_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    _start_broadcast(context, resume_only=True)
+
+
+async def stop_morning_reminders() -> None:
+    """Stops a running broadcast and checkpoints it, must be called while the bot can still send"""
+    global _broadcast
+    if _broadcast is None:
+        return
+    _broadcast.cancel()
+    try:
+        await _broadcast
+    except asyncio.CancelledError:
+        pass
+    _broadcast = None
+
+
+def schedule_morning_reminders(job_queue: JobQueue) -> None:
+    settings = get_settings()
+    remind_at = day_time(hour=settings.reminder_hour, tzinfo=ZoneInfo(settings.timezone))
+    job_queue.run_daily(send_morning_reminders, remind_at, name="morning_reminders")
+    # the claim of a run that crashed has to expire before it can be resumed
+    job_queue.run_once(resume_morning_reminders, settings.broadcast_lease + 1, name="morning_reminders_resume")
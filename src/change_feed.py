@@ -0,0 +1,97 @@
+import asyncio
+from collections import defaultdict
+import json
+from typing import Callable
+
+from sqlalchemy.engine import make_url
+
+from src.logger import logger
+from src.settings import get_settings
+
+
+# channel the notify_user_change trigger publishes to
+CHANGES_CHANNEL = "todofrog_changes"
+
+
+class ChangeFeed:
+    """Listens to row changes published by the database triggers.
+
+    Every bot process runs one listener on its own connection, outside
+    of the engine's pool. Subscribers get the telegram id of the user
+    whose rows changed, in any process. Notifications sent while the
+    listener was disconnected are lost, so subscribers are also asked
+    to drop everything after each reconnect.
+    """
+
+    def __init__(self, channel: str = CHANGES_CHANNEL, reconnect_delay: float = 5.0):
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._on_change: dict[str, list[Callable[[int], None]]] = defaultdict(list)
+        self._on_resync: list[Callable[[], None]] = []
+        self._listener: asyncio.Task | None = None
+        self.connected = asyncio.Event()
+
+    def subscribe(self, table: str, on_change: Callable[[int], None], on_resync: Callable[[], None]) -> None:
+        self._on_change[table].append(on_change)
+        if on_resync not in self._on_resync:
+            self._on_resync.append(on_resync)
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            change = json.loads(payload)
+            table, user_id = change["table"], int(change["user_id"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed change notification: %s", payload)
+            return
+
+        for on_change in self._on_change.get(table, ()):
+            on_change(user_id)
+
+    def _resync(self) -> None:
+        for on_resync in self._on_resync:
+            on_resync()
+
+    async def _listen_once(self) -> None:
+        import asyncpg
+
+        settings = get_settings()
+        dsn = make_url(settings.db_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        connection = await asyncpg.connect(dsn, **settings.db_connect_args)
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _: closed.set())
+        try:
+            await connection.add_listener(self.channel, lambda _connection, _pid, _channel, payload: self.dispatch(payload))
+            # changes made before LISTEN took effect were never seen
+            self._resync()
+            self.connected.set()
+            await closed.wait()
+        finally:
+            self.connected.clear()
+            await connection.close()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await self._listen_once()
+                logger.warning("Change feed connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Change feed listener failed: %s", e)
+            await asyncio.sleep(self.reconnect_delay)
+
+    def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+change_feed = ChangeFeed()
@@ -1,37 +1,166 @@
 from contextlib import asynccontextmanager
+from functools import lru_cache
 import ssl
+import time
 from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from telegram.ext import CallbackContext
 
+from src.metrics import (
+    REGISTRY,
+    DB_POOL_CHECKOUT_WAIT,
+    DB_QUERY_ERRORS,
+    DB_QUERY_LATENCY,
+    DB_SESSION_ERRORS,
+    DB_SESSION_LATENCY,
+    Gauge,
+    statement_kind,
+)
 from src.settings import get_settings
 
 
-async_engine = create_async_engine(
-    get_settings().db_url,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,
-    pool_recycle=540,
-    echo=False,
-    connect_args=get_settings().db_connect_args,
-)
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Records how long checkouts wait for a free connection, opening a new one included"""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started_at)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if context is not None:
+        context.query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started_at = getattr(context, "query_started_at", None)
+    if started_at is not None:
+        DB_QUERY_LATENCY.labels(statement_kind(statement)).observe(time.perf_counter() - started_at)
+
+
+def _handle_error(exception_context) -> None:
+    DB_QUERY_ERRORS.labels(statement_kind(exception_context.statement or "")).inc()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+@lru_cache
+def get_engine() -> AsyncEngine:
+    """Creates the engine on first use, so importing the module doesn't load the DB driver"""
+    engine = create_async_engine(
+        get_settings().db_url,
+        poolclass=TimedQueuePool,
+        pool_size=get_settings().db_pool_size,
+        max_overflow=get_settings().db_max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=540,
+        echo=False,
+        connect_args=get_settings().db_connect_args,
+    )
+    instrument_engine(engine)
+    return engine
+
+
+def get_pool_usage() -> float:
+    """Share of the pool's connections, overflow included, that are checked out right now"""
+    settings = get_settings()
+    return get_engine().pool.checkedout() / (settings.db_pool_size + settings.db_max_overflow)
+
+
+def get_checked_out_connections() -> int:
+    return get_engine().pool.checkedout()
+
+
+REGISTRY.register(Gauge(
+    "todofrog_db_pool_checked_out", "Pooled database connections checked out right now",
+    function=get_checked_out_connections,
+))
+
 
 async def create_tables() -> None:
     from src.models import User, Task
-    async with async_engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
 @asynccontextmanager
 async def get_session():
-    session = AsyncSession(async_engine)
+    session = AsyncSession(get_engine())
+    started_at = time.perf_counter()
     try:
         yield session
     except Exception:
+        DB_SESSION_ERRORS.labels("session").inc()
         await session.rollback()
         raise
     finally:
         await session.close()
+        DB_SESSION_LATENCY.labels("session").observe(time.perf_counter() - started_at)
+
+
+# set in session.info of sessions that are committed once per update
+UNIT_OF_WORK = "unit_of_work"
+
+
+@asynccontextmanager
+async def get_update_session(context: CallbackContext):
+    """Returns the session shared by every handler and helper of the current update.
+
+    The session is created by the outermost caller, which commits it once
+    when it's done and closes it. Nested callers reuse it and leave
+    committing to the outermost one. AsyncSession checks out a pooled
+    connection only on its first query, so updates that never touch the
+    database don't hold one, and handlers call release_connection() before
+    their Bot API requests, so none is held while Telegram is waited for.
+    """
+    session = getattr(context, "db_session", None)
+    if session is not None:
+        yield session
+        return
+
+    # loaded objects stay usable after release_connection() commits mid-update
+    session = AsyncSession(get_engine(), info={UNIT_OF_WORK: True}, expire_on_commit=False)
+    context.db_session = session
+    started_at = time.perf_counter()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        DB_SESSION_ERRORS.labels("update").inc()
+        await session.rollback()
+        raise
+    finally:
+        context.db_session = None
+        await session.close()
+        DB_SESSION_LATENCY.labels("update").observe(time.perf_counter() - started_at)
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """Commits the work done so far and returns the session's connection to the pool.
+
+    Bot API requests may wait for the rate limiter or a RetryAfter for
+    seconds, which must not be spent idle in a transaction. The session
+    checks out a connection again on its next query, and without one
+    the commit doesn't reach the database.
+    """
+    await session.commit()
+
+
+async def commit(session: AsyncSession) -> None:
+    """Commits the session, or only flushes it if it's committed at the end of the update"""
+    if UNIT_OF_WORK in session.info:
+        await session.flush()
+    else:
+        await session.commit()
 
 
 if __name__ == "__main__":
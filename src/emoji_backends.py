@@ -0,0 +1,73 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from importlib.resources import files
+import json
+
+from src.emoji_cache import normalize_description
+
+
+EMOJI_KEYWORDS_FILE_NAME = "emoji_keywords.json"
+# shorter stems match whole words only, as prefixes they match unrelated words, e.g. "кот" in "котлеты"
+MIN_PREFIX_LENGTH = 5
+# prepositions, particles and numbers say nothing about the task
+MIN_WORD_LENGTH = 3
+
+
+class EmojiBackend(ABC):
+    """Source of task emojis used by LLMService"""
+
+    # local backends answer without network calls and are cheaper than any cache lookup
+    is_local: bool = False
+
+    @abstractmethod
+    async def suggest_emoji(self, description: str) -> tuple[str, float]:
+        """Returns an emoji for the task description and the confidence in it from 0 to 1"""
+
+
+class KeywordEmojiBackend(EmojiBackend):
+    """Offline backend: picks an emoji by word stems from a precomputed keyword index.
+
+    Every word of the normalized description votes for the emoji of its
+    longest matching stem. The confidence is the share of the winning votes
+    among all meaningful words, so words no stem matched lower it.
+    """
+
+    is_local = True
+
+    def __init__(self, keywords: dict[str, list[str]]):
+        self.stem_index: dict[str, str] = {
+            stem: emoji
+            for emoji, stems in keywords.items()
+            for stem in stems
+        }
+        self.max_stem_length = max(map(len, self.stem_index), default=0)
+
+    @classmethod
+    def from_assets(cls) -> "KeywordEmojiBackend":
+        keywords = json.loads(files("assets").joinpath(EMOJI_KEYWORDS_FILE_NAME).read_text(encoding="utf-8"))
+        return cls(keywords)
+
+    def _match_word(self, word: str) -> str | None:
+        emoji = self.stem_index.get(word)
+        if emoji is not None:
+            return emoji
+        for length in range(min(len(word) - 1, self.max_stem_length), MIN_PREFIX_LENGTH - 1, -1):
+            emoji = self.stem_index.get(word[:length])
+            if emoji is not None:
+                return emoji
+        return None
+
+    def match(self, description: str) -> tuple[str, float]:
+        words = [
+            word
+            for word in normalize_description(description).split()
+            if len(word) >= MIN_WORD_LENGTH and word.isalpha()
+        ]
+        votes = Counter(emoji for word in words if (emoji := self._match_word(word)) is not None)
+        if not votes:
+            return "", 0.0
+        emoji, count = votes.most_common(1)[0]
+        return emoji, count / len(words)
+
+    async def suggest_emoji(self, description: str) -> tuple[str, float]:
+        return self.match(description)
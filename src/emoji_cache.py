@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable
+import unicodedata
+
+from sqlalchemy.dialects.postgresql import insert
+
+from src.database import get_session
+from src.metrics import EMOJI_CACHE_LOOKUPS
+from src.models.emoji_cache_entry import EmojiCacheEntry
+from src.settings import get_settings
+from src.logger import logger
+
+
+def normalize_description(description: str) -> str:
+    """Builds the cache key: case, punctuation and repeated whitespace are ignored"""
+    text = "".join(
+        " " if unicodedata.category(char).startswith("P") else char
+        for char in description.casefold().replace("ё", "е")
+    )
+    return " ".join(text.split())
+
+
+class EmojiCache:
+    """Emoji lookup in front of the LLM: in-process LRU first, then the emoji_cache table"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
+
+    def _remember(self, key: str, emoji: str) -> None:
+        self._entries[key] = emoji
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_generate(self, description: str, generate: Callable[[str], Awaitable[str]]) -> str:
+        """Returns the cached emoji for the description, calling generate on a miss.
+
+        The table is read and written in short sessions of their own, so
+        no pooled connection is held while the LLM is generating.
+        """
+        key = normalize_description(description)
+
+        emoji = self._entries.get(key)
+        if emoji is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            EMOJI_CACHE_LOOKUPS.labels("memory_hit").inc()
+            return emoji
+
+        async with get_session() as session:
+            entry = await session.get(EmojiCacheEntry, key)
+        if entry:
+            self.db_hits += 1
+            EMOJI_CACHE_LOOKUPS.labels("db_hit").inc()
+            self._remember(key, entry.emoji)
+            return entry.emoji
+
+        self.misses += 1
+        EMOJI_CACHE_LOOKUPS.labels("miss").inc()
+        emoji = await generate(description)
+        try:
+            async with get_session() as session:
+                await session.execute(
+                    insert(EmojiCacheEntry)
+                    .values(description_key=key, emoji=emoji)
+                    .on_conflict_do_nothing(index_elements=["description_key"])
+                )
+                await session.commit()
+        except Exception as e:
+            # the emoji is still good for the task, it's generated again after a restart
+            logger.warning("Failed to persist emoji for %r: %s", key, e)
+        self._remember(key, emoji)
+        return emoji
+
+
+emoji_cache = EmojiCache(get_settings().emoji_cache_size)
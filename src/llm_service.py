@@ -1,6 +1,12 @@
-from yandex_cloud_ml_sdk import AsyncYCloudML
+import asyncio
+import re
+import time
+import unicodedata
 
+from src.emoji_backends import EmojiBackend, KeywordEmojiBackend
 from src.settings import get_settings
+from src.logger import logger
+from src.metrics import LLM_ERRORS, LLM_LATENCY
 
 
 GENERATE_EMOJI_PROMPT = {
@@ -13,13 +19,136 @@ GENERATE_EMOJI_PROMPT = {
 """,
 }
 
+GENERATE_EMOJIS_BATCH_PROMPT = {
+    "role": "system",
+    "text": """
+Тебе дан нумерованный список описаний задач, по одной задаче на строку.
+Для каждой задачи сгенерируй один подходящий по смыслу эмодзи.
+Отвечай строго одной строкой на каждую задачу в том же порядке, в каждой строке только эмодзи.
+НЕ ОТВЕЧАЙ НИЧЕМ, КРОМЕ ЭМОДЗИ.
+Если ни один эмодзи не подходит по смыслу, используй любой нейтральный эмодзи.
+""",
+}
 
-class LLMService:
-    def __init__(self):
-        self.model = AsyncYCloudML(
-            folder_id=get_settings().yandex_cloud_folder,
-            auth=get_settings().yandex_gpt_api_key,
-        ).models.completions("yandexgpt").configure(temperature=0.3)
+# numbering the model may echo back, e.g. "2. 🛏" or "2) 🛏", but not keycaps like "1️⃣"
+BATCH_LINE_PREFIX = re.compile(r"^\s*\d+(?:\s*[.):-]\s*|\s+)")
+
+# tasks.emoji and emoji_cache.emoji are VARCHAR(8)
+MAX_EMOJI_LENGTH = 8
+# symbols plus what glues them into one emoji: skin tones, variation selectors, keycaps and ZWJ
+EMOJI_CATEGORIES = {"So", "Sk", "Mn", "Me", "Cf"}
+KEYCAP = "\u20e3"
+
+
+def is_emoji(text: str) -> bool:
+    """Tells a short emoji apart from words, numbers or a whole sentence"""
+    if not 0 < len(text) <= MAX_EMOJI_LENGTH:
+        return False
+    if text.endswith(KEYCAP):
+        # keycaps start with the plain character, e.g. "1️⃣"
+        text = text[1:]
+    return all(unicodedata.category(char) in EMOJI_CATEGORIES for char in text)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+
+class EmojiGenerationError(Exception):
+    """Raised when a backend failed and no confident emoji was suggested"""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures.
+
+    After recovery_timeout seconds a single trial request is let through:
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        if self._trial_in_progress:
+            return True
+        return time.monotonic() - self.opened_at < self.recovery_timeout
+
+    def before_request(self) -> bool:
+        """Raises CircuitOpenError while open, returns whether the request is the trial one"""
+        if self.is_open:
+            raise CircuitOpenError("LLM circuit breaker is open")
+        if self.opened_at is not None:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    def cancel_trial(self) -> None:
+        # a cancelled trial says nothing about the provider, the next request is tried instead
+        self._trial_in_progress = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_progress = False
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("LLM circuit breaker opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class YandexGPTBackend(EmojiBackend):
+    def __init__(
+        self,
+        batch_window_ms: int = 0,
+        max_batch_size: int = 1,
+        max_concurrency: int = 4,
+        request_timeout: float = 5.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+    ):
+        self._model = None
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.request_timeout = request_timeout
+        self.circuit_breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self._semaphore = asyncio.BoundedSemaphore(max_concurrency)
+
+        # identical descriptions share one future while their request is in flight
+        self._in_flight: dict[str, asyncio.Future[str]] = {}
+        self._pending: list[str] = []
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task] = set()
+
+    @property
+    def model(self):
+        """The YandexGPT client, built on first use.
+
+        The SDK pulls in grpc and protobuf, so importing it is left
+        until a request actually needs the remote model.
+        """
+        if self._model is None:
+            from yandex_cloud_ml_sdk import AsyncYCloudML
+
+            self._model = AsyncYCloudML(
+                folder_id=get_settings().yandex_cloud_folder,
+                auth=get_settings().yandex_gpt_api_key,
+            ).models.completions("yandexgpt").configure(temperature=0.3)
+        return self._model
+
+    @model.setter
+    def model(self, model) -> None:
+        self._model = model
 
     async def generate_task_title(self, description: str) -> str:
         messages = [
@@ -29,10 +158,85 @@ class LLMService:
                 "text": description,
             },
         ]
-        response = await self.model.run(messages)
+        response = await self._run_model(messages)
         return response.alternatives[0].text
-    
+
+    async def _run_model(self, messages: list[dict]):
+        """Runs the model within the concurrency limit and the request deadline.
+
+        The deadline also covers waiting for a free slot, so a stalled
+        provider can't pile up callers behind the semaphore.
+        """
+        try:
+            is_trial = self.circuit_breaker.before_request()
+        except CircuitOpenError:
+            LLM_ERRORS.labels("circuit_open").inc()
+            raise
+        try:
+            response = await asyncio.wait_for(self._run_limited(messages), self.request_timeout)
+        except asyncio.CancelledError:
+            # otherwise the breaker would wait for the trial's outcome forever
+            if is_trial:
+                self.circuit_breaker.cancel_trial()
+            raise
+        except Exception as e:
+            LLM_ERRORS.labels("timeout" if isinstance(e, asyncio.TimeoutError) else "error").inc()
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+        return response
+
+    async def _run_limited(self, messages: list[dict]):
+        async with self._semaphore:
+            # only the provider's time, waiting for a slot isn't counted
+            with LLM_LATENCY.time():
+                return await self.model.run(messages)
+
     async def generate_task_emoji(self, description: str) -> str:
+        """Generates an emoji, batching descriptions that arrive within the batch window.
+
+        Raises CircuitOpenError right away while the provider is considered down.
+        """
+        if self.circuit_breaker.is_open:
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        future = self._in_flight.get(description)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._in_flight[description] = loop.create_future()
+            self._pending.append(description)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_timer is None:
+                self._flush_timer = loop.call_later(self.batch_window, self._flush)
+        # a cancelled caller must not cancel the request shared with others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: list[str]) -> None:
+        try:
+            if len(batch) == 1:
+                emojis = [await self._generate_single_emoji(batch[0])]
+            else:
+                emojis = await self._generate_batch_emojis(batch)
+        except Exception as e:
+            for description in batch:
+                self._in_flight.pop(description).set_exception(e)
+        else:
+            for description, emoji in zip(batch, emojis):
+                self._in_flight.pop(description).set_result(emoji)
+
+    async def _generate_single_emoji(self, description: str) -> str:
         messages = [
             GENERATE_EMOJI_PROMPT,
             {
@@ -40,8 +244,110 @@ class LLMService:
                 "text": description,
             },
         ]
-        response = await self.model.run(messages)
+        response = await self._run_model(messages)
         return response.alternatives[0].text
 
+    async def _generate_batch_emojis(self, descriptions: list[str]) -> list[str]:
+        messages = [
+            GENERATE_EMOJIS_BATCH_PROMPT,
+            {
+                "role": "user",
+                "text": "\n".join(
+                    f"{i}. {description}" for i, description in enumerate(descriptions, start=1)
+                ),
+            },
+        ]
+        response = await self._run_model(messages)
+        emojis = [
+            BATCH_LINE_PREFIX.sub("", line).strip()
+            for line in response.alternatives[0].text.splitlines()
+            if line.strip()
+        ]
+        if len(emojis) != len(descriptions):
+            logger.warning(
+                "Batch emoji response has %d lines for %d descriptions, falling back to single requests",
+                len(emojis),
+                len(descriptions),
+            )
+        elif not all(is_emoji(emoji) for emoji in emojis):
+            logger.warning("Batch emoji response has lines that aren't emojis, falling back to single requests")
+        else:
+            return emojis
+
+        return list(await asyncio.gather(
+            *(self._generate_single_emoji(description) for description in descriptions)
+        ))
+
+
+    async def suggest_emoji(self, description: str) -> tuple[str, float]:
+        return await self.generate_task_emoji(description), 1.0
+
+
+class LLMService:
+    """Generates task emojis with a chain of backends.
+
+    Backends are asked in order until one is confident enough, so cheap
+    local backends go first and the remote model is used only when needed.
+    """
+
+    def __init__(self, backends: list[EmojiBackend], min_confidence: float, fallback_emoji: str):
+        self.backends = backends
+        self.min_confidence = min_confidence
+        self.fallback_emoji = fallback_emoji
+
+    async def suggest_local_emoji(self, description: str) -> str | None:
+        """Returns a confident emoji from local backends only, None if there is none"""
+        for backend in self.backends:
+            if not backend.is_local:
+                continue
+            emoji, confidence = await backend.suggest_emoji(description)
+            if confidence >= self.min_confidence:
+                return emoji
+        return None
+
+    async def generate_task_emoji(self, description: str) -> str:
+        """Returns the first confident suggestion.
+
+        Without one, the best low-confidence guess is returned, unless a
+        backend failed: then EmojiGenerationError is raised so that the
+        guess isn't cached in place of a real answer.
+        """
+        best_emoji, best_confidence = "", 0.0
+        error = None
+        for backend in self.backends:
+            try:
+                emoji, confidence = await backend.suggest_emoji(description)
+            except Exception as e:
+                error = e
+                continue
+            if confidence >= self.min_confidence:
+                return emoji
+            if confidence > best_confidence:
+                best_emoji, best_confidence = emoji, confidence
+
+        if error is not None:
+            raise EmojiGenerationError(f"Failed to generate emoji: {error}") from error
+        return best_emoji or self.fallback_emoji
+
+
+def create_emoji_backend(name: str) -> EmojiBackend:
+    settings = get_settings()
+    if name == "local":
+        return KeywordEmojiBackend.from_assets()
+    if name == "yandexgpt":
+        return YandexGPTBackend(
+            batch_window_ms=settings.llm_batch_window_ms,
+            max_batch_size=settings.llm_batch_max_size,
+            max_concurrency=settings.llm_max_concurrency,
+            request_timeout=settings.llm_request_timeout,
+            failure_threshold=settings.llm_failure_threshold,
+            recovery_timeout=settings.llm_recovery_timeout,
+        )
+    raise ValueError(f"Unknown emoji backend: {name}")
+
 
-llm_service = LLMService()
+llm_service = LLMService(
+    backends=[create_emoji_backend(name) for name in get_settings().emoji_backends],
+    min_confidence=get_settings().local_emoji_min_confidence,
+    fallback_emoji=get_settings().llm_fallback_emoji,
+)
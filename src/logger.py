@@ -1,5 +1,13 @@
+import atexit
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import functools
+import json
 import logging
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import queue
+from typing import Any, Awaitable, Callable
+
 from src.settings import get_settings
 
 # ANSI escape codes for colors
@@ -14,6 +22,10 @@ COLORS = {
     'WHITE': '\033[37m',
 }
 
+# fields of the update being handled, e.g. user_id, update_id, handler and latency_ms
+log_context: ContextVar[dict[str, Any] | None] = ContextVar("log_context", default=None)
+
+
 class ColoredFormatter(logging.Formatter):
     LEVEL_COLORS = {
         'DEBUG': COLORS['BLUE'],
@@ -28,38 +40,109 @@ class ColoredFormatter(logging.Formatter):
         self.use_colors = use_colors
 
     def format(self, record):
+        # the record is shared by all handlers, so a copy gets the padded and colored fields
+        record = logging.makeLogRecord(record.__dict__)
+        record_name = f"{record.filename}:{record.lineno}"
         if self.use_colors:
             level_color = self.LEVEL_COLORS.get(record.levelname, COLORS['WHITE'])
             record.levelname = f"{level_color}{record.levelname:<5}{COLORS['RESET']}"
-            
-            record_name = record.filename + ":" + str(record.lineno)
             record.name = f"{COLORS['CYAN']}{record_name:<12}{COLORS['RESET']}"
         else:
             record.levelname = f"{record.levelname:<5}"
-            record.name = f"{record.filename}:{record.lineno:<12}"
+            record.name = f"{record_name:<12}"
+
+        message = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            message += " | " + " ".join(f"{key}={value}" for key, value in context.items())
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields of the update being handled"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """Hands records to the listener thread, which formats and writes them.
+
+    Everything that depends on the event loop's thread is resolved here:
+    the message, the traceback and the update's context.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        context = log_context.get()
+        record.context = dict(context) if context else {}
+        return record
+
+
+def log_handler(callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Adds the name of the handler to the log context of the update it handles"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        fields = log_context.get()
+        if fields is not None:
+            fields["handler"] = callback.__name__
+        return await callback(update, context)
+    return wrapper
+
+
+def get_log_level(settings) -> int:
+    if settings.log_level:
+        return logging.getLevelName(settings.log_level.upper())
+    return logging.DEBUG if settings.dev_mode else logging.INFO
 
-        return super().format(record)
 
 def setup_logger():
     settings = get_settings()
-    formatter = ColoredFormatter(
-        use_colors=settings.dev_mode,
-        fmt='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
+    if settings.dev_mode:
+        formatter = ColoredFormatter(
+            use_colors=True,
+            fmt='%(asctime)s | %(levelname)s | %(name)s | %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+    else:
+        formatter = JsonFormatter()
+
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
+
+    # writing to stdout can block, so it's done by the listener's thread instead of the event loop
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(console_handler)
-    
+    logger.setLevel(get_log_level(settings))
+    logger.addHandler(ContextQueueHandler(records))
+
     logging.getLogger('asyncio').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('telegram').setLevel(logging.WARNING)
-    
+
     return logger
 
 logger = setup_logger()
@@ -0,0 +1,71 @@
+from functools import lru_cache
+from importlib.resources import files
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Message
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from src.database import commit, release_connection
+from src.models.telegram_file import TelegramFile
+from src.logger import logger
+
+
+TASK_LIST_IMAGE_NAME = "tasks_list.jpg"
+
+# Telegram file ids of already uploaded media, keyed by asset name
+_file_ids: dict[str, str] = {}
+
+
+async def get_file_id(session: AsyncSession, name: str) -> str | None:
+    """Returns the cached Telegram file id of the asset, loading it from the database on a miss"""
+    file_id = _file_ids.get(name)
+    if file_id is None:
+        telegram_file = await session.get(TelegramFile, name)
+        if telegram_file:
+            file_id = _file_ids[name] = telegram_file.file_id
+    return file_id
+
+
+async def save_file_id(session: AsyncSession, name: str, file_id: str) -> None:
+    """Stores the Telegram file id of the asset in memory and in the database"""
+    if _file_ids.get(name) == file_id:
+        return
+    _file_ids[name] = file_id
+    await session.merge(TelegramFile(name=name, file_id=file_id))
+    await commit(session)
+
+
+@lru_cache
+def load_asset(name: str) -> bytes:
+    return files("assets").joinpath(name).read_bytes()
+
+
+def forget_file_id(name: str) -> None:
+    _file_ids.pop(name, None)
+
+
+async def send_cached_photo(
+    session: AsyncSession,
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    name: str,
+    content: bytes,
+    **kwargs,
+) -> Message:
+    """Sends the photo by its cached file id, uploading the content only when there is no usable id"""
+    file_id = await get_file_id(session, name)
+    # the id is read from the database only once per process, don't hold its connection while sending
+    await release_connection(session)
+    if file_id:
+        try:
+            return await context.bot.send_photo(chat_id, file_id, **kwargs)
+        except BadRequest as e:
+            logger.warning("Cached file id of %s was rejected, uploading it again: %s", name, e)
+            forget_file_id(name)
+
+    message = await context.bot.send_photo(chat_id, content, **kwargs)
+    await save_file_id(session, name, message.photo[-1].file_id)
+    # requests of the update may follow, e.g. deleting the old list
+    await release_connection(session)
+    return message
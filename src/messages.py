@@ -27,6 +27,8 @@ ALL_TASKS_COMPLETED_MESSAGE = """
 *Но не забудь запланировать новые на завтра!*
 """
 
+TASK_NOT_FOUND_MESSAGE = "Задача уже выполнена или удалена"
+
 NO_TASKS_FOUND_MESSAGE = """
 По задачам пока пусто 🥸
 Создать задачу можно с помощью команды /create_task или кнопкой на клавиатуре.
@@ -39,6 +41,16 @@ TOO_MANY_TASKS_MESSAGE = """
 Пусть они и душные, но их выполнение принесет тебе огромное удовлетворение!
 """
 
+MORNING_REMINDER_MESSAGE = """
+☀️ Доброе утро!
+Самое время запланировать *до 5 небольших задач* на сегодня.
+
+Создать задачу можно с помощью команды /create\\_task или кнопкой на клавиатуре.
+"""
+
+# shown on a task that jumped over unfinished days, see START_MESSAGE
+TASK_JUMPS_MARKER = "🐸×{jumps}"
+
 TASK_REPLY_MESSAGE = """
 {description}
 """
\ No newline at end of file
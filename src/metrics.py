@@ -0,0 +1,290 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import functools
+import math
+import time
+from typing import Any, Awaitable, Callable
+
+from src.logger import logger
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """A metric family, values are kept per combination of label values"""
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], Any] = {}
+
+    @abstractmethod
+    def _new_child(self):
+        """Returns the value holder of one combination of label values"""
+
+    def labels(self, *values: Any):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _samples(self) -> list[tuple[str, dict[str, str], float]]:
+        """Returns the name, labels and value of every sample to render"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [
+            (f"{self.name}_total", dict(zip(self.labelnames, key)), child.value)
+            for key, child in self._children.items()
+        ]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a function when scraped.
+
+    The function of a labelled gauge returns the values by their label values.
+    """
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], float | dict[tuple[str, ...], float]] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception as e:
+                logger.debug("Failed to read gauge %s: %s", self.name, e)
+                return []
+            if not self.labelnames:
+                return [(self.name, {}, values)]
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in values.items()]
+        return [(self.name, dict(zip(self.labelnames, key)), child.value) for key, child in self._children.items()]
+
+
+class _Buckets:
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, buckets: _Buckets):
+        self.buckets = buckets
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.buckets.observe(time.perf_counter() - self.started_at)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self):
+        samples = []
+        for key, child in self._children.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(child.bounds, child.counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, child.count))
+            samples.append((f"{self.name}_sum", labels, child.sum))
+            samples.append((f"{self.name}_count", labels, child.count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATE_LATENCY = REGISTRY.register(Histogram(
+    "todofrog_update_seconds", "Time from receiving an update until it is handled, waiting for the user's earlier updates included",
+))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge("todofrog_updates_in_flight", "Updates received and not handled yet"))
+HANDLER_LATENCY = REGISTRY.register(Histogram("todofrog_handler_seconds", "Time spent in update handlers", ("handler",)))
+HANDLER_ERRORS = REGISTRY.register(Counter("todofrog_handler_errors", "Update handlers that raised", ("handler",)))
+DB_SESSION_LATENCY = REGISTRY.register(Histogram(
+    "todofrog_db_session_seconds", "Lifetime of database sessions", ("kind",),
+))
+DB_SESSION_ERRORS = REGISTRY.register(Counter("todofrog_db_session_errors", "Database sessions rolled back on an error", ("kind",)))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram("todofrog_db_query_seconds", "Time of database statements", ("statement",)))
+DB_QUERY_ERRORS = REGISTRY.register(Counter("todofrog_db_query_errors", "Database statements that failed", ("statement",)))
+DB_POOL_CHECKOUT_WAIT = REGISTRY.register(Histogram(
+    "todofrog_db_pool_checkout_wait_seconds", "Time waited for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+))
+LLM_LATENCY = REGISTRY.register(Histogram("todofrog_llm_request_seconds", "Time of YandexGPT model runs"))
+LLM_ERRORS = REGISTRY.register(Counter("todofrog_llm_errors", "Failed YandexGPT requests", ("reason",)))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram("todofrog_telegram_request_seconds", "Time of Bot API requests", ("endpoint",)))
+TELEGRAM_ERRORS = REGISTRY.register(Counter("todofrog_telegram_errors", "Failed Bot API requests", ("endpoint", "error")))
+TELEGRAM_RATE_LIMIT_WAIT = REGISTRY.register(Histogram(
+    "todofrog_telegram_rate_limit_wait_seconds", "Time Bot API requests waited for the rate limiter", ("priority",),
+))
+EMOJI_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "todofrog_emoji_cache_lookups", "Emoji cache lookups by where the emoji was found", ("result",),
+))
+TASK_CACHE_LOOKUPS = REGISTRY.register(Counter("todofrog_task_cache_lookups", "Pending task list cache lookups", ("result",)))
+
+
+def statement_kind(statement: str) -> str:
+    """Returns the statement's first keyword, e.g. SELECT, which keeps the label set small"""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else ""
+
+
+@contextmanager
+def count_errors(counter: Counter, *labels: Any):
+    """Counts exceptions by the given labels and the exception's class name"""
+    try:
+        yield
+    except Exception as e:
+        counter.labels(*labels, type(e).__name__).inc()
+        raise
+
+
+def observe_handler(callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Records the latency and errors of an update handler"""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started_at = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started_at)
+    return wrapper
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serves the metrics at /metrics, tornado is imported only when they are enabled"""
+    import tornado.httpserver
+    import tornado.web
+
+    class MetricsHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.write(REGISTRY.render())
+
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([("/metrics", MetricsHandler)]))
+    server.listen(port, host)
+    logger.info("Serving metrics on %s:%d", host, port)
+    return server
@@ -1,4 +1,9 @@
 from .user import User
 from .task import Task
+from .telegram_file import TelegramFile
+from .emoji_cache_entry import EmojiCacheEntry
+from .task_rollover import TaskRollover
+from .reminder_broadcast import ReminderBroadcast
+from .conversation_state import ConversationState, UserData
 
-__all__ = ["User", "Task"]
+__all__ = ["User", "Task", "TelegramFile", "EmojiCacheEntry", "TaskRollover", "ReminderBroadcast", "ConversationState", "UserData"]
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import BigInteger, Column, DateTime, LargeBinary, Text, text
+
+
+class ConversationState(SQLModel, table=True):
+    __tablename__ = "conversation_states"
+
+    name: str = Field(sa_column=Column(Text, primary_key=True))
+    # the conversation key as a JSON list, e.g. [chat_id, user_id]
+    key: str = Field(sa_column=Column(Text, primary_key=True))
+    state: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    updated_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP")
+        )
+    )
+
+
+class UserData(SQLModel, table=True):
+    __tablename__ = "user_data"
+
+    user_id: int = Field(sa_column=Column(BigInteger, primary_key=True, autoincrement=False))
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    updated_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP")
+        )
+    )
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime, Text, text
+
+
+class EmojiCacheEntry(SQLModel, table=True):
+    __tablename__ = "emoji_cache"
+
+    description_key: str = Field(sa_column=Column(Text, primary_key=True))
+    emoji: str = Field(max_length=8, nullable=False)
+    created_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP")
+        )
+    )
@@ -0,0 +1,32 @@
+from datetime import date, datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import BigInteger, Column, DateTime, text
+
+
+class ReminderBroadcast(SQLModel, table=True):
+    """Progress of the day's morning reminder, users up to last_user_id are done"""
+    __tablename__ = "reminder_broadcasts"
+
+    day: date = Field(primary_key=True)
+    last_user_id: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    sent: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    blocked: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    failed: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    started_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP")
+        )
+    )
+    # a run renews its claim with every checkpoint, an expired claim can be taken over
+    claimed_until: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+    finished_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
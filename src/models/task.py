@@ -3,7 +3,7 @@ from datetime import datetime
 from typing import Optional
 
 from sqlmodel import Field, SQLModel, ForeignKey, Relationship
-from sqlalchemy import Column, Enum, DateTime, Text, text
+from sqlalchemy import Column, Enum, DateTime, Index, Integer, Text, text
 
 
 class TaskStatus(EnumType):
@@ -14,6 +14,13 @@ class TaskStatus(EnumType):
 
 class Task(SQLModel, table=True):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index(
+            "ix_tasks_user_id_pending",
+            "user_id",
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(max_length=255, nullable=False)
@@ -42,5 +49,8 @@ class Task(SQLModel, table=True):
         )
     )
 
+    # number of days the task jumped over unfinished
+    jumps: int = Field(default=0, sa_column=Column(Integer, nullable=False, server_default=text("0")))
+
     user_id: int = Field(foreign_key="users.telegram_id")
     user: Optional["User"] = Relationship(back_populates="tasks")
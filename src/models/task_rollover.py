@@ -0,0 +1,25 @@
+from datetime import date, datetime
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import BigInteger, Column, DateTime, text
+
+
+class TaskRollover(SQLModel, table=True):
+    """Progress of the daily rollover, committed together with every chunk"""
+    __tablename__ = "task_rollovers"
+
+    day: date = Field(primary_key=True)
+    last_task_id: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    jumped_tasks: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+    started_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP")
+        )
+    )
+    finished_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
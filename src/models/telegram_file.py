@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, DateTime, text
+
+
+class TelegramFile(SQLModel, table=True):
+    __tablename__ = "telegram_files"
+
+    name: str = Field(max_length=255, primary_key=True)
+    file_id: str = Field(max_length=255, nullable=False)
+    updated_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP"),
+            onupdate=text("CURRENT_TIMESTAMP"),
+        )
+    )
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from sqlmodel import Field, Relationship, SQLModel
 from sqlalchemy import Column, DateTime, text
@@ -17,5 +17,10 @@ class User(SQLModel, table=True):
             server_default=text("CURRENT_TIMESTAMP")
         )
     )
+    # set when a broadcast finds the bot blocked, such users get no more broadcasts
+    blocked_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
 
     tasks: List["Task"] = Relationship(back_populates="user")
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import pickle
+from typing import Any
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import delete, func, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src.database import get_session
+from src.models.conversation_state import ConversationState, UserData
+from src.logger import logger
+
+
+ConversationKey = tuple[int | str, ...]
+
+
+class PostgresPersistence(BasePersistence[dict, dict, dict]):
+    """Stores conversation states and user data in Postgres.
+
+    The application hands over changed entries every update_interval
+    seconds, all at once. They are collected and written together with
+    multi-row statements in one transaction, later changes of the same
+    entry replace earlier ones. States and data are pickled.
+    """
+
+    def __init__(self, update_interval: float = 5.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # None means the entry is deleted
+        self._conversations: dict[tuple[str, str], bytes | None] = {}
+        self._user_data: dict[int, bytes | None] = {}
+        self._batch: asyncio.Future | None = None
+        self._writes: set[asyncio.Task] = set()
+        # users that have or may have a row, an empty dict of any other user needs no statement
+        self._stored_users: set[int] = set()
+
+    def _enqueue(self) -> asyncio.Future:
+        """Returns the future of the batch the change was added to"""
+        if self._batch is None:
+            loop = asyncio.get_running_loop()
+            self._batch = loop.create_future()
+            # the application updates everything concurrently, so the batch is written once they all queued
+            loop.call_soon(self._start_write)
+        return self._batch
+
+    def _start_write(self) -> None:
+        task = asyncio.create_task(self._write())
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self) -> None:
+        conversations, user_data, batch = self._conversations, self._user_data, self._batch
+        self._conversations, self._user_data, self._batch = {}, {}, None
+
+        try:
+            async with get_session() as session:
+                await self._write_conversations(session, conversations)
+                await self._write_user_data(session, user_data)
+                await session.commit()
+        except Exception as e:
+            # changes made meanwhile are newer than the failed ones
+            for key, state in conversations.items():
+                self._conversations.setdefault(key, state)
+            for user_id, data in user_data.items():
+                self._user_data.setdefault(user_id, data)
+            logger.error("Failed to write persistence batch: %s", e)
+            batch.set_exception(e)
+            return
+
+        for user_id, data in user_data.items():
+            if data is None and user_id not in self._user_data:
+                self._stored_users.discard(user_id)
+        logger.debug("Persisted %d conversation states and %d user data", len(conversations), len(user_data))
+        batch.set_result(None)
+
+    @staticmethod
+    async def _write_conversations(session, conversations: dict[tuple[str, str], bytes | None]) -> None:
+        updated = [
+            {"name": name, "key": key, "state": state}
+            for (name, key), state in conversations.items()
+            if state is not None
+        ]
+        deleted = [key for key, state in conversations.items() if state is None]
+        if updated:
+            statement = insert(ConversationState).values(updated)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=["name", "key"],
+                set_={"state": statement.excluded.state, "updated_at": func.now()},
+            ))
+        if deleted:
+            await session.execute(
+                delete(ConversationState)
+                .where(tuple_(ConversationState.name, ConversationState.key).in_(deleted))
+            )
+
+    @staticmethod
+    async def _write_user_data(session, user_data: dict[int, bytes | None]) -> None:
+        updated = [{"user_id": user_id, "data": data} for user_id, data in user_data.items() if data is not None]
+        deleted = [user_id for user_id, data in user_data.items() if data is None]
+        if updated:
+            statement = insert(UserData).values(updated)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={"data": statement.excluded.data, "updated_at": func.now()},
+            ))
+        if deleted:
+            await session.execute(delete(UserData).where(UserData.user_id.in_(deleted)))
+
+    async def get_conversations(self, name: str) -> dict[ConversationKey, object]:
+        async with get_session() as session:
+            rows = (await session.execute(
+                select(ConversationState.key, ConversationState.state)
+                .where(ConversationState.name == name)
+            )).all()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: object | None) -> None:
+        self._conversations[(name, json.dumps(list(key)))] = None if new_state is None else pickle.dumps(new_state)
+        await self._enqueue()
+
+    async def get_user_data(self) -> dict[int, dict]:
+        async with get_session() as session:
+            rows = (await session.execute(select(UserData.user_id, UserData.data))).all()
+        self._stored_users.update(user_id for user_id, _ in rows)
+        return {user_id: pickle.loads(data) for user_id, data in rows}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # the application passes the data of every user it saw, an empty dict needs no row
+        # and users that never had one are skipped instead of being deleted on every flush
+        if data:
+            self._stored_users.add(user_id)
+        elif user_id not in self._stored_users:
+            return
+        self._user_data[user_id] = pickle.dumps(data) if data else None
+        await self._enqueue()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_data[user_id] = None
+        await self._enqueue()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # changes of a failed batch are still pending without a batch of their own
+        if self._batch is not None or self._conversations or self._user_data:
+            await self._enqueue()
+
+    # chat data, bot data and callback data are not stored
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self) -> Any:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
@@ -0,0 +1,218 @@
+import asyncio
+from dataclasses import dataclass, field
+from enum import IntEnum
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Coroutine
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from src.logger import logger
+from src.metrics import TELEGRAM_ERRORS, TELEGRAM_LATENCY, TELEGRAM_RATE_LIMIT_WAIT, count_errors
+
+
+class Priority(IntEnum):
+    """Order in which queued requests get global tokens, lower goes first"""
+    REPLY = 0
+    DEFAULT = 1
+    CLEANUP = 2
+    BROADCAST = 3
+
+
+ENDPOINT_PRIORITIES = {
+    "answerCallbackQuery": Priority.REPLY,
+    "sendMessage": Priority.REPLY,
+    "sendPhoto": Priority.REPLY,
+    "editMessageCaption": Priority.REPLY,
+    "editMessageMedia": Priority.REPLY,
+    "editMessageReplyMarkup": Priority.REPLY,
+    "editMessageText": Priority.REPLY,
+    "deleteMessage": Priority.CLEANUP,
+    "deleteMessages": Priority.CLEANUP,
+}
+
+# endpoints that post a new message to the chat and fall under the per-chat limit
+MESSAGE_ENDPOINT_PREFIXES = ("send", "copyMessage", "forwardMessage")
+
+# idle per-chat buckets are dropped once there are more of them than this
+MAX_IDLE_CHATS = 10_000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def delay(self) -> float:
+        """Returns seconds until a token is available, 0 if there is one now"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+@dataclass
+class ChatQueue:
+    bucket: TokenBucket
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    waiting: int = 0
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """Rate limiter every Bot API request of the application goes through.
+
+    Requests that post messages first pass their chat's queue, which
+    admits them in order at the per-chat rate. Then every request waits
+    for a token of the global bucket; queued requests get tokens by
+    Priority, so user-facing replies overtake cleanup deletes. A
+    RetryAfter pauses all requests for the requested time and the
+    failed request is retried.
+
+    The priority can be set per call with ``rate_limit_args``,
+    otherwise it is derived from the endpoint.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._chats: dict[int | str, ChatQueue] = {}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._has_waiters = asyncio.Event()
+        self._paused_until = 0.0
+        self._dispatcher: asyncio.Task | None = None
+
+        # requests waiting in a chat queue or for a global token
+        self._queued: dict[Priority, int] = {priority: 0 for priority in Priority}
+
+    def queue_depths(self) -> dict[tuple[str], int]:
+        """Returns the number of waiting requests by priority name, for the queue depth gauge"""
+        return {(priority.name.lower(),): count for priority, count in self._queued.items()}
+
+    async def initialize(self) -> None:
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def _dispatch(self) -> None:
+        """Hands out global tokens to queued requests by priority"""
+        while True:
+            await self._has_waiters.wait()
+
+            delay = max(self._paused_until - time.monotonic(), self.global_bucket.delay())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._has_waiters.clear()
+            if future.done():
+                # the waiting request was cancelled
+                continue
+            self.global_bucket.take()
+            future.set_result(None)
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._has_waiters.set()
+        await future
+
+    def _get_chat_queue(self, chat_id: int | str) -> ChatQueue:
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            if len(self._chats) >= MAX_IDLE_CHATS:
+                self._chats = {
+                    key: queue
+                    for key, queue in self._chats.items()
+                    if queue.waiting or not queue.bucket.is_full
+                }
+            queue = self._chats[chat_id] = ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+        return queue
+
+    async def _admit(self, chat_id: int | str | None, endpoint: str, priority: int) -> None:
+        if chat_id is None or not endpoint.startswith(MESSAGE_ENDPOINT_PREFIXES):
+            await self._acquire_global(priority)
+            return
+
+        queue = self._get_chat_queue(chat_id)
+        queue.waiting += 1
+        try:
+            async with queue.lock:
+                while (delay := queue.bucket.delay()) > 0:
+                    await asyncio.sleep(delay)
+                queue.bucket.take()
+                await self._acquire_global(priority)
+        finally:
+            queue.waiting -= 1
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict[str, Any] | list[dict[str, Any]]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict[str, Any] | list[dict[str, Any]]:
+        if self._dispatcher is None:
+            await self.initialize()
+
+        priority = Priority(rate_limit_args if rate_limit_args is not None else ENDPOINT_PRIORITIES.get(endpoint, Priority.DEFAULT))
+        chat_id = data.get("chat_id")
+
+        for attempt in range(self.max_retries + 1):
+            started_at = time.monotonic()
+            self._queued[priority] += 1
+            try:
+                await self._admit(chat_id, endpoint, priority)
+            finally:
+                self._queued[priority] -= 1
+            TELEGRAM_RATE_LIMIT_WAIT.labels(priority.name.lower()).observe(time.monotonic() - started_at)
+
+            try:
+                with TELEGRAM_LATENCY.labels(endpoint).time(), count_errors(TELEGRAM_ERRORS, endpoint):
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    logger.error("Rate limit hit for %s after %d retries", endpoint, attempt)
+                    raise
+                logger.warning("Rate limit hit for %s, pausing requests for %s seconds", endpoint, e.retry_after)
+                # no tokens are handed out until the flood wait is over, the retry is queued as usual
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after + 0.1)
@@ -0,0 +1,151 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, time as day_time, timedelta
+import time
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import DateTime, Integer, cast, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import func, select, update
+from telegram.ext import ContextTypes, JobQueue
+
+from src.database import get_session
+from src.models.task import Task, TaskStatus
+from src.models.task_rollover import TaskRollover
+from src.settings import get_settings
+from src.task_cache import task_cache
+from src.logger import logger
+
+
+@dataclass
+class RolloverReport:
+    day: date
+    jumped_tasks: int
+    chunks: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.jumped_tasks / self.seconds if self.seconds else 0.0
+
+
+def get_day_start(now: datetime, rollover_hour: int) -> datetime:
+    """Returns when the current day started, days begin at rollover_hour"""
+    day_start = now.replace(hour=rollover_hour, minute=0, second=0, microsecond=0)
+    if day_start > now:
+        day_start -= timedelta(days=1)
+    return day_start
+
+
+def _day_starts_since(updated_at, day_start: datetime):
+    """Counts the day starts a task stayed pending through, more than one if rollovers were missed"""
+    elapsed = func.extract("epoch", literal(day_start, DateTime(timezone=True)) - updated_at)
+    return cast(func.floor(elapsed / timedelta(days=1).total_seconds()), Integer) + 1
+
+
+async def _roll_over_chunk(day: date, day_start: datetime, chunk_size: int) -> tuple[int, bool]:
+    """Moves the next chunk of tasks to the day, returns the number of jumped tasks and whether it's done"""
+    async with get_session() as session:
+        # the lock keeps replicas running the job at the same time from jumping a task twice
+        checkpoint = await session.scalar(
+            select(TaskRollover)
+            .where(TaskRollover.day == day)
+            .with_for_update()
+        )
+        if checkpoint.finished_at is not None:
+            return 0, True
+
+        # the jump sets updated_at past day_start itself, rather than leaving it to the trigger,
+        # so a task jumps at most once a day even if the day's checkpoint is lost
+        chunk = (
+            select(Task.id)
+            .where(Task.id > checkpoint.last_task_id)
+            .where(Task.status == TaskStatus.PENDING)
+            .where(Task.created_at < day_start)
+            .where(Task.updated_at < day_start)
+            .order_by(Task.id)
+            .limit(chunk_size)
+            .cte("chunk")
+        )
+        jumped = (
+            update(Task)
+            .where(Task.id.in_(select(chunk.c.id)))
+            .where(Task.status == TaskStatus.PENDING)
+            .values(jumps=Task.jumps + _day_starts_since(Task.updated_at, day_start), updated_at=func.now())
+            .returning(Task.id)
+            .cte("jumped")
+        )
+        jumped_count, last_task_id = (await session.execute(select(
+            select(func.count()).select_from(jumped).scalar_subquery(),
+            select(func.max(chunk.c.id)).scalar_subquery(),
+        ))).one()
+
+        checkpoint.jumped_tasks += jumped_count
+        if last_task_id is None:
+            checkpoint.finished_at = func.now()
+        else:
+            checkpoint.last_task_id = last_task_id
+        await session.commit()
+        return jumped_count, last_task_id is None
+
+
+async def roll_over_pending_tasks(
+        day_start: datetime,
+        chunk_size: int = 10_000,
+        pause: float = 0.05,
+) -> RolloverReport:
+    """Makes pending tasks created before day_start jump to the new day.
+
+    Tasks are updated by id in chunks, each in its own short transaction
+    that also records the progress in task_rollovers. An interrupted
+    rollover continues after the last committed chunk, a finished one
+    isn't repeated. A task jumps once for every day start since it was
+    last updated, so the run at startup also catches up on days the bot
+    was down. The pause between chunks leaves the pool and the event
+    loop to the interactive handlers.
+    """
+    day = day_start.date()
+    async with get_session() as session:
+        await session.execute(
+            insert(TaskRollover)
+            .values(day=day)
+            .on_conflict_do_nothing(index_elements=["day"])
+        )
+        await session.commit()
+
+    jumped_tasks = chunks = 0
+    started_at = time.monotonic()
+    while True:
+        jumped_count, done = await _roll_over_chunk(day, day_start, chunk_size)
+        jumped_tasks += jumped_count
+        if done:
+            break
+        chunks += 1
+        await asyncio.sleep(pause)
+
+    if jumped_tasks:
+        # cached lists would show the old jump counts until they expire
+        task_cache.clear()
+    report = RolloverReport(day, jumped_tasks, chunks, time.monotonic() - started_at)
+    logger.info(
+        "Frog jump for %s: %d tasks in %d chunks, %.2f s, %.0f rows/s",
+        report.day, report.jumped_tasks, report.chunks, report.seconds, report.rows_per_second,
+    )
+    return report
+
+
+async def frog_jump_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    settings = get_settings()
+    day_start = get_day_start(datetime.now(ZoneInfo(settings.timezone)), settings.rollover_hour)
+    try:
+        await roll_over_pending_tasks(day_start, settings.rollover_chunk_size, settings.rollover_chunk_pause)
+    except Exception as e:
+        logger.error("Frog jump failed, it continues on the next run: %s", e)
+
+
+def schedule_frog_jump(job_queue: JobQueue) -> None:
+    settings = get_settings()
+    rollover_at = day_time(hour=settings.rollover_hour, tzinfo=ZoneInfo(settings.timezone))
+    job_queue.run_daily(frog_jump_job, rollover_at, name="frog_jump")
+    # catches up on rollovers that were missed or interrupted while the bot was down
+    job_queue.run_once(frog_jump_job, 0, name="frog_jump_catch_up")
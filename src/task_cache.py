@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import time
+from typing import Any, Awaitable, Callable
+
+from src.metrics import TASK_CACHE_LOOKUPS
+from src.models.task import Task
+from src.settings import get_settings
+
+
+@dataclass
+class CachedTasks:
+    expires_at: float
+    # plain column values, so cached tasks never touch a session
+    rows: tuple[dict[str, Any], ...]
+
+
+class PendingTaskCache:
+    """Per-user LRU of pending task lists with a TTL.
+
+    Entries are dropped by invalidate() whenever TaskManager changes a
+    user's tasks. A list that was loaded while the user's tasks were
+    invalidated is returned but not cached, since it may be stale.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, CachedTasks] = OrderedDict()
+        self._loading: dict[int, int] = {}
+        self._invalidated_while_loading: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
+
+    def _remember(self, user_id: int, tasks: list[Task]) -> None:
+        self._entries[user_id] = CachedTasks(
+            expires_at=time.monotonic() + self.ttl,
+            rows=tuple(task.model_dump() for task in tasks),
+        )
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+        if user_id in self._loading:
+            self._invalidated_while_loading.add(user_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(self, user_id: int, load: Callable[[], Awaitable[list[Task]]]) -> list[Task]:
+        """Returns the user's pending tasks, calling load on a miss or an expired entry"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                TASK_CACHE_LOOKUPS.labels("hit").inc()
+                return [Task(**row) for row in entry.rows]
+            del self._entries[user_id]
+
+        self.misses += 1
+        TASK_CACHE_LOOKUPS.labels("miss").inc()
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            tasks = await load()
+        finally:
+            self._loading[user_id] -= 1
+            stale = user_id in self._invalidated_while_loading
+            if not self._loading[user_id]:
+                del self._loading[user_id]
+                self._invalidated_while_loading.discard(user_id)
+
+        if not stale:
+            self._remember(user_id, tasks)
+        return tasks
+
+
+task_cache = PendingTaskCache(get_settings().task_cache_size, get_settings().task_cache_ttl)
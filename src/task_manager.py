@@ -1,12 +1,22 @@
-from sqlmodel import select
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database import commit
 from src.models.task import Task, TaskStatus
 from src.models.user import User
-from src.llm_service import llm_service
+from src.emoji_cache import emoji_cache
+from src.task_cache import task_cache
+from src.llm_service import EmojiGenerationError, llm_service
+from src.logger import logger
 
 
 MAX_DESCRIPTION_LENGTH = 35
+# shown while the emoji is generated in the background
+PLACEHOLDER_EMOJI = "⏳"
+# session.info key with users whose tasks were changed within the session
+CHANGED_USERS = "changed_users"
 
 class TaskManager:
     def __init__(self, session: AsyncSession):
@@ -20,8 +30,47 @@ class TaskManager:
         )
         return tasks
 
-    async def create_task(self, user_id: int, username: str, description: str) -> None:
-        emoji = await llm_service.generate_task_emoji(description)
+    def _invalidate(self, user_id: int) -> None:
+        task_cache.invalidate(user_id)
+        self.session.info.setdefault(CHANGED_USERS, set()).add(user_id)
+
+    async def _load_pending_user_tasks(self, user_id: int) -> list[Task]:
+        tasks = await self._get_user_tasks(user_id)
+        return list(tasks.scalars().all())
+
+    async def _generate_emoji(self, description: str) -> str:
+        emoji = await llm_service.suggest_local_emoji(description)
+        if emoji:
+            return emoji
+
+        # the fallback is returned outside of the cache, so it is never persisted;
+        # only LLM failures fall back, database errors are left to the caller
+        try:
+            return await emoji_cache.get_or_generate(description, llm_service.generate_task_emoji)
+        except EmojiGenerationError as e:
+            logger.error("Failed to generate emoji, using fallback: %s", e)
+            return llm_service.fallback_emoji
+
+    async def create_task(
+        self,
+        user_id: int,
+        username: str,
+        description: str,
+        emoji: str | None = None,
+    ) -> int:
+        """Creates a pending task and returns its id.
+
+        The emoji is generated by the LLM unless it is passed explicitly,
+        e.g. a placeholder that is filled later by fill_task_emoji.
+        """
+        if emoji is None:
+            emoji = await self._generate_emoji(description)
+        # a new user's row is otherwise created only once a list is shown, and tasks reference it
+        await self.session.execute(
+            insert(User)
+            .values(telegram_id=user_id)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        )
         new_task = Task(
             user_id=user_id,
             username=username,
@@ -29,23 +78,82 @@ class TaskManager:
             emoji=emoji,
         )
         self.session.add(new_task)
-        await self.session.commit()
+        await self.session.flush()
+        task_id = new_task.id
+        self._invalidate(user_id)
+        await commit(self.session)
+        return task_id
+
+    async def fill_task_emoji(self, task_id: int, description: str) -> str:
+        emoji = await self._generate_emoji(description)
+        user_id = await self.session.scalar(
+            update(Task)
+            .where(Task.id == task_id)
+            .values(emoji=emoji)
+            .returning(Task.user_id)
+        )
+        if user_id is not None:
+            self._invalidate(user_id)
+        await commit(self.session)
+        return emoji
 
     async def get_pending_user_tasks(self, user_id: int) -> list[Task]:
-        tasks = await self._get_user_tasks(user_id)
-        return tasks.scalars().all()
+        """Returns the user's pending tasks, from the cache unless this session changed them.
+
+        Reads after a write within the same transaction go to the database,
+        so uncommitted tasks never get into the cache.
+        """
+        if user_id in self.session.info.get(CHANGED_USERS, ()):
+            return await self._load_pending_user_tasks(user_id)
+        return await task_cache.get_or_load(user_id, lambda: self._load_pending_user_tasks(user_id))
 
     async def get_task_count(self, user_id: int) -> int:
-        tasks = await self._get_user_tasks(user_id)
-        return len(tasks.all())
+        # a user has only a handful of pending tasks, the cached list is cheaper than a count query
+        return len(await self.get_pending_user_tasks(user_id))
 
     async def get_task(self, task_id: int) -> Task:
         return await self.session.get(Task, task_id)
     
-    async def change_task_status(self, task_id: int, action: str) -> None:
-        task = await self.get_task(task_id)
+    async def change_task_status(self, task_id: int, action: str, user_id: int) -> list[Task] | None:
+        """Completes or deletes a pending task of the user in a single statement.
+
+        Returns the user's remaining pending tasks, or None if the user has
+        no pending task with this id, e.g. the button is stale or was sent
+        by someone else.
+        """
+        owned_pending_task = and_(
+            Task.id == task_id,
+            Task.user_id == user_id,
+            Task.status == TaskStatus.PENDING,
+        )
         if action == "complete":
-            task.status = TaskStatus.COMPLETED
+            change = update(Task).where(owned_pending_task).values(status=TaskStatus.COMPLETED)
         elif action == "delete":
-            await self.session.delete(task)
-        await self.session.commit()
+            change = delete(Task).where(owned_pending_task)
+        else:
+            raise ValueError(f"Unknown task action: {action}")
+
+        changed = change.returning(Task.id).cte("changed")
+        # an aggregate always yields a row, so the result is known even with no tasks left
+        outcome = select(func.count().label("changed")).select_from(changed).cte("outcome")
+        # the query sees the tasks as they were before the change, hence the id filter
+        rows = (await self.session.execute(
+            select(outcome.c.changed, Task)
+            .select_from(outcome)
+            .outerjoin(Task, and_(
+                Task.user_id == user_id,
+                Task.status == TaskStatus.PENDING,
+                Task.id != task_id,
+            ))
+        )).all()
+
+        tasks = [task for _, task in rows if task is not None]
+        # detached, so a commit doesn't expire them before they are rendered
+        for task in tasks:
+            self.session.expunge(task)
+
+        self._invalidate(user_id)
+        await commit(self.session)
+        if not rows[0].changed:
+            return None
+        return tasks
@@ -0,0 +1,141 @@
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import Any, Awaitable, Callable
+
+from telegram import Update, User
+from telegram.ext import BaseUpdateProcessor
+
+from src.logger import log_context, logger
+from src.metrics import UPDATE_LATENCY, UPDATES_IN_FLIGHT
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of one user strictly in order and different users in parallel.
+
+    Updates of the same user, e.g. a double tapped button, wait for each
+    other before they take a concurrency slot, so they never race on the
+    same task or list message and don't hold slots while waiting.
+
+    max_concurrent_updates is the hard ceiling. With adapt_interval set,
+    the effective limit follows an additive increase, multiplicative
+    decrease scheme: it is halved while the event loop lags behind or the
+    DB pool is exhausted and grows by one otherwise.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        min_concurrent_updates: int = 1,
+        adapt_interval: float | None = None,
+        max_loop_lag: float = 0.1,
+        get_pool_usage: Callable[[], float] | None = None,
+    ):
+        super().__init__(max_concurrent_updates)
+        self.min_concurrent_updates = min(min_concurrent_updates, max_concurrent_updates)
+        self.limit = max_concurrent_updates
+        self.adapt_interval = adapt_interval
+        self.max_loop_lag = max_loop_lag
+        self.get_pool_usage = get_pool_usage
+
+        self._active = 0
+        self._slots = asyncio.Condition()
+        self._user_locks: dict[int, asyncio.Lock] = {}
+        self._user_pending: dict[int, int] = {}
+        self._adapter: asyncio.Task | None = None
+
+    @property
+    def active_updates(self) -> int:
+        return self._active
+
+    async def initialize(self) -> None:
+        if self.adapt_interval and self._adapter is None:
+            self._adapter = asyncio.create_task(self._adapt())
+
+    async def shutdown(self) -> None:
+        if self._adapter is not None:
+            self._adapter.cancel()
+            try:
+                await self._adapter
+            except asyncio.CancelledError:
+                pass
+            self._adapter = None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # the base class would take a slot of its own first, so waiting updates
+        # of a user would hold slots after all; _slot() is the only limit here
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        token = log_context.set({
+            "update_id": update.update_id if isinstance(update, Update) else None,
+            "user_id": user.id if user else None,
+        })
+        started_at = time.monotonic()
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            await self._process_update(user, coroutine)
+        finally:
+            # waiting for the user's previous updates counts towards the latency
+            latency = time.monotonic() - started_at
+            UPDATES_IN_FLIGHT.dec()
+            UPDATE_LATENCY.observe(latency)
+            log_context.get()["latency_ms"] = round(latency * 1000, 1)
+            logger.info("Update handled")
+            log_context.reset(token)
+
+    async def _process_update(self, user: User | None, coroutine: Awaitable[Any]) -> None:
+        if user is None:
+            async with self._slot():
+                await coroutine
+            return
+
+        lock = self._user_locks.setdefault(user.id, asyncio.Lock())
+        self._user_pending[user.id] = self._user_pending.get(user.id, 0) + 1
+        try:
+            async with lock, self._slot():
+                await coroutine
+        finally:
+            self._user_pending[user.id] -= 1
+            if not self._user_pending[user.id]:
+                del self._user_pending[user.id]
+                del self._user_locks[user.id]
+
+    @asynccontextmanager
+    async def _slot(self):
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        try:
+            yield
+        finally:
+            async with self._slots:
+                self._active -= 1
+                self._slots.notify()
+
+    def adjust_limit(self, loop_lag: float, pool_usage: float) -> int:
+        previous = self.limit
+        if loop_lag > self.max_loop_lag or pool_usage >= 1.0:
+            self.limit = max(self.min_concurrent_updates, self.limit // 2)
+        else:
+            self.limit = min(self.max_concurrent_updates, self.limit + 1)
+        if self.limit != previous:
+            logger.debug(
+                "Concurrent updates limit %d -> %d (loop lag %.3fs, pool usage %.0f%%)",
+                previous, self.limit, loop_lag, pool_usage * 100,
+            )
+        return self.limit
+
+    async def _adapt(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.adapt_interval)
+            loop_lag = loop.time() - started_at - self.adapt_interval
+            pool_usage = self.get_pool_usage() if self.get_pool_usage else 0.0
+
+            previous = self.limit
+            if self.adjust_limit(loop_lag, pool_usage) > previous:
+                async with self._slots:
+                    self._slots.notify_all()
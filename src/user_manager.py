@@ -1,6 +1,110 @@
+import asyncio
+
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database import commit, get_session
 from src.models.user import User
+from src.logger import logger
+
+
+class ListMessageIdBuffer:
+    """Write-behind buffer for User.list_message_id.
+
+    Updates are kept in memory and written in bulk with a single
+    multi-row upsert by flush(), which runs on an interval and on
+    shutdown. Reads must go through get() to see values that are not
+    flushed yet.
+    """
+
+    def __init__(self):
+        self._pending: dict[int, int | None] = {}
+        # the batch being written, still read until its commit succeeds
+        self._flushing: dict[int, int | None] = {}
+        self._flusher: asyncio.Task | None = None
+
+    def set(self, user_id: int, message_id: int | None) -> None:
+        self._pending[user_id] = message_id
+
+    def get(self, user_id: int, default: int | None = None) -> int | None:
+        if user_id in self._pending:
+            return self._pending[user_id]
+        return self._flushing.get(user_id, default)
+
+    def forget(self, user_id: int) -> None:
+        self._pending.pop(user_id, None)
+
+    async def flush(self) -> int:
+        """Writes all pending updates, returns the number of written rows"""
+        if not self._pending:
+            return 0
+
+        batch = self._flushing = self._pending
+        self._pending = {}
+        statement = insert(User).values([
+            {"telegram_id": user_id, "list_message_id": message_id}
+            for user_id, message_id in batch.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            # a user who opens the list has unblocked the bot
+            set_={"list_message_id": statement.excluded.list_message_id, "blocked_at": None},
+        )
+        committed = False
+        try:
+            async with get_session() as session:
+                await session.execute(statement)
+                await session.commit()
+                committed = True
+        except BaseException:
+            # also when the periodic flush is cancelled by stop(), which flushes again;
+            # values set while flushing are newer than the failed ones
+            if not committed:
+                for user_id, message_id in batch.items():
+                    self._pending.setdefault(user_id, message_id)
+            raise
+        finally:
+            self._flushing = {}
+
+        logger.debug("Flushed list message ids of %d users", len(batch))
+        return len(batch)
+
+    async def _flush_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush list message ids: %s", e)
+
+    def start(self, interval: float) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically(interval))
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+list_message_ids = ListMessageIdBuffer()
+
+
+def get_list_message_id(user: User | None) -> int | None:
+    """Returns the user's latest list message id, including a not yet flushed one"""
+    if user is None:
+        return None
+    return list_message_ids.get(user.telegram_id, user.list_message_id)
+
+
+def clear_list_message_id(user_id: int) -> None:
+    """Records that the user's list message shows something else now, e.g. a task card"""
+    list_message_ids.set(user_id, None)
 
 
 async def update_user_list_message_id(
@@ -18,14 +122,13 @@ async def update_user_list_message_id(
         message_id (int): The message ID to store
 
     The function will:
-    - Create a new user if one doesn't exist
-    - Update the existing user's list_message_id if it differs
+    - Create a new user if one doesn't exist, right away since tasks reference it
+    - Buffer the update of the existing user's list_message_id if it differs
     - Do nothing if the message ID is the same as the current one
     """
     if not user:
         user = User(telegram_id=user_id, list_message_id=message_id+1)
         session.add(user)
-        await session.commit()
-    elif user.list_message_id != message_id:
-        user.list_message_id = message_id
-        await session.commit()
+        await commit(session)
+    elif get_list_message_id(user) != message_id:
+        list_message_ids.set(user_id, message_id)
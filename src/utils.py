@@ -1,4 +1,8 @@
+import asyncio
+from typing import Any, Coroutine, Hashable
+
 from telegram import Update, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 from src.logger import logger
@@ -43,3 +47,87 @@ async def delete_message(update: Update, context: ContextTypes.DEFAULT_TYPE, mes
         logger.debug("Successfully deleted message %d", message_id)
     except Exception as e:
         logger.error("Failed to delete message %d: %s", message_id, e)
+
+
+async def edit_caption_in_place(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    message_id: int,
+    caption: str | None = None,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    parse_mode: str | None = None,
+) -> bool:
+    """Edits caption and keyboard of a media message, returns False if the message can't be edited"""
+    try:
+        await context.bot.edit_message_caption(
+            chat_id,
+            message_id,
+            caption=caption,
+            reply_markup=reply_markup,
+            parse_mode=parse_mode,
+        )
+    except BadRequest as e:
+        # e.g. a double tap renders the same content twice
+        if "message is not modified" in e.message.lower():
+            return True
+        logger.debug("Failed to edit message %d in place: %s", message_id, e)
+        return False
+    return True
+
+
+class SideEffectSkipped(Exception):
+    """Raised for an ordered side effect whose predecessor failed"""
+
+
+class SideEffects:
+    """Runs independent side effects of a handler concurrently.
+
+    Effects start as soon as they are added. Effects added with the same
+    key run one after another in the order they were added, and one that
+    follows a failed effect is skipped, e.g. the old list is not deleted
+    if the new one couldn't be sent. Effects without a key run
+    independently. Leaving the block waits for all of them and logs
+    every failure separately.
+
+    Effects run concurrently with each other, so at most one of them may
+    use the database session.
+    """
+
+    def __init__(self):
+        self._tasks: list[tuple[str, asyncio.Task]] = []
+        self._tails: dict[Hashable, asyncio.Task] = {}
+        self.errors: list[BaseException] = []
+
+    def add(self, coroutine: Coroutine[Any, Any, Any], key: Hashable | None = None, name: str = "") -> asyncio.Task:
+        name = name or coroutine.__qualname__
+        previous = self._tails.get(key) if key is not None else None
+        task = asyncio.create_task(self._run(coroutine, previous, name))
+        if key is not None:
+            self._tails[key] = task
+        self._tasks.append((name, task))
+        return task
+
+    @staticmethod
+    async def _run(coroutine: Coroutine[Any, Any, Any], previous: asyncio.Task | None, name: str) -> Any:
+        if previous is not None:
+            await asyncio.wait([previous])
+            if previous.cancelled() or previous.exception() is not None:
+                coroutine.close()
+                raise SideEffectSkipped(f"{name} skipped, previous side effect failed")
+        return await coroutine
+
+    async def __aenter__(self) -> "SideEffects":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if not self._tasks:
+            return
+        results = await asyncio.gather(*(task for _, task in self._tasks), return_exceptions=True)
+        for (name, _), result in zip(self._tasks, results):
+            if isinstance(result, SideEffectSkipped):
+                logger.warning("%s", result)
+            elif isinstance(result, BaseException):
+                logger.error("Side effect %s failed: %s", name, result)
+            else:
+                continue
+            self.errors.append(result)
@@ -0,0 +1,229 @@
+import asyncio
+import json
+from math import ceil
+import multiprocessing
+import os
+import signal
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.web
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from src.logger import logger
+from src.settings import Settings, get_settings
+
+
+WORKER_HOST = "127.0.0.1"
+WEBHOOK_PATH = "/webhook"
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def get_update_user_id(data: dict) -> int | None:
+    """Returns the id of the user the update came from, or the chat id for updates without a user"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def get_worker_index(data: dict, workers: int) -> int:
+    """Picks the worker for an update, all updates of a user go to the same one"""
+    user_id = get_update_user_id(data)
+    return user_id % workers if user_id is not None else 0
+
+
+def get_worker_environment(settings: Settings, workers: int) -> dict[str, str]:
+    """Splits the host-wide limits between workers, each has its own pool and rate limiter.
+
+    The broadcast runs in one worker, but only within that worker's share
+    of the global limit, so it is scaled down with it and leaves the
+    worker's replies the same headroom as in a single process.
+    """
+    return {
+        "DB_POOL_SIZE": str(max(1, ceil(settings.db_pool_size / workers))),
+        "DB_MAX_OVERFLOW": str(ceil(settings.db_max_overflow / workers)),
+        "RATE_LIMIT_GLOBAL_PER_SECOND": str(settings.rate_limit_global_per_second / workers),
+        "BROADCAST_RATE": str(settings.broadcast_rate / workers),
+    }
+
+
+class WorkerRouter:
+    def __init__(self, ports: list[int]):
+        self.ports = ports
+        self._locks = [asyncio.Lock() for _ in ports]
+        self._client = tornado.httpclient.AsyncHTTPClient()
+
+    async def forward(self, index: int, body: bytes) -> None:
+        # one update at a time per worker, so a user's updates reach it in the order they came
+        async with self._locks[index]:
+            await self._client.fetch(
+                f"http://{WORKER_HOST}:{self.ports[index]}{WEBHOOK_PATH}",
+                method="POST",
+                body=body,
+                headers={"Content-Type": "application/json"},
+            )
+
+
+class ReceiverHandler(tornado.web.RequestHandler):
+    def initialize(self, router: WorkerRouter, secret_token: str) -> None:
+        self.router = router
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        if self.secret_token and self.request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+
+        index = get_worker_index(data, len(self.router.ports))
+        try:
+            await self.router.forward(index, self.request.body)
+        except Exception as e:
+            logger.error("Failed to forward update %s to worker %d: %s", data.get("update_id"), index, e)
+            # Telegram delivers the update again later
+            raise tornado.web.HTTPError(503)
+
+
+class WorkerHandler(tornado.web.RequestHandler):
+    def initialize(self, app: Application) -> None:
+        self.app = app
+
+    async def post(self) -> None:
+        update = Update.de_json(json.loads(self.request.body), self.app.bot)
+        await self.app.update_queue.put(update)
+
+
+def _stop_on_signals(stopping: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+
+async def _serve_worker(index: int, port: int) -> None:
+    from src.bot import build_application
+    from src.database import get_engine
+    from src.media_manager import TASK_LIST_IMAGE_NAME, load_asset
+
+    get_engine()
+    load_asset(TASK_LIST_IMAGE_NAME)
+    metrics_port = get_settings().metrics_port
+    # the daily jobs run once per host
+    app = build_application(
+        with_updater=False,
+        schedule_jobs=index == 0,
+        metrics_port=metrics_port + index if metrics_port else 0,
+    )
+
+    stopping = asyncio.Event()
+    _stop_on_signals(stopping)
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([
+        (WEBHOOK_PATH, WorkerHandler, {"app": app}),
+    ]))
+
+    # run_webhook isn't used, so the post_* callbacks are called here
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    server.listen(port, WORKER_HOST)
+    logger.info("Webhook worker %d is listening on port %d", index, port)
+    try:
+        await stopping.wait()
+    finally:
+        server.stop()
+        await app.stop()
+        await app.post_stop(app)
+        await app.shutdown()
+        await app.post_shutdown(app)
+
+
+def run_worker(index: int, port: int) -> None:
+    asyncio.run(_serve_worker(index, port))
+
+
+async def wait_for_ports(ports: list[int], timeout: float, interval: float = 0.1) -> None:
+    """Waits until every port on the worker host accepts connections.
+
+    Raises asyncio.TimeoutError if some port still doesn't after timeout seconds.
+    """
+    async def wait_for_port(port: int) -> None:
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(WORKER_HOST, port)
+            except OSError:
+                await asyncio.sleep(interval)
+                continue
+            writer.close()
+            await writer.wait_closed()
+            return
+
+    await asyncio.wait_for(asyncio.gather(*(wait_for_port(port) for port in ports)), timeout)
+
+
+async def _serve_receiver(port: int, worker_ports: list[int], start_worker, start_timeout: float = 60.0) -> None:
+    settings = get_settings()
+    stopping = asyncio.Event()
+    _stop_on_signals(stopping)
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([
+        (WEBHOOK_PATH, ReceiverHandler, {
+            "router": WorkerRouter(worker_ports),
+            "secret_token": settings.webhook_secret_token,
+        }),
+    ]))
+
+    processes = [start_worker(index) for index in range(len(worker_ports))]
+    try:
+        # updates are accepted only once there is a worker to forward them to,
+        # otherwise Telegram gets errors for them while the workers start
+        await wait_for_ports(worker_ports, start_timeout)
+        server.listen(port, "0.0.0.0")
+        async with Bot(settings.bot_token, **settings.bot_api_urls) as bot:
+            await bot.set_webhook(settings.webhook_url, secret_token=settings.webhook_secret_token or None)
+        logger.info("Webhook receiver is listening on port %d, routing to %d workers", port, len(worker_ports))
+
+        while not stopping.is_set():
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error("Webhook worker %d exited with code %s, restarting it", index, process.exitcode)
+                    processes[index] = start_worker(index)
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        server.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            await asyncio.to_thread(process.join)
+
+
+def run_sharded_webhook() -> None:
+    """Runs the webhook receiver, which routes updates by user to worker processes.
+
+    Every worker is a complete bot with its own event loop, database pool
+    and rate limiter, listening on a local port for the updates the
+    receiver forwards. Routing by user keeps a user's updates, and with
+    them the conversation state, in one process.
+    """
+    settings = get_settings()
+    worker_ports = [settings.webhook_worker_base_port + index for index in range(settings.webhook_workers)]
+    # spawned workers inherit the environment, so they read their share of the limits as settings
+    os.environ.update(get_worker_environment(settings, settings.webhook_workers))
+    spawn = multiprocessing.get_context("spawn")
+
+    def start_worker(index: int) -> multiprocessing.Process:
+        process = spawn.Process(target=run_worker, args=(index, worker_ports[index]), name=f"webhook-worker-{index}")
+        process.start()
+        return process
+
+    asyncio.run(_serve_receiver(int(os.environ.get("PORT", 8080)), worker_ports, start_worker))
@@ -0,0 +1,91 @@
+import pytest
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.load_test import LatencyStats, find_regressions, percentile, status_changed
+from benchmarks.stub_llm import StubModel
+from src.llm_service import GENERATE_EMOJI_PROMPT, GENERATE_EMOJIS_BATCH_PROMPT
+from src.messages import TASK_NOT_FOUND_MESSAGE
+
+
+def test_percentiles_use_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+
+    assert [percentile(values, q) for q in (50, 95, 99)] == [50.0, 95.0, 99.0]
+    assert percentile([0.2], 99) == 0.2
+    assert percentile([], 50) == 0.0
+
+
+def test_summary_skips_warm_up_and_flags_regressions():
+    stats = LatencyStats()
+    for seconds in (0.1, 0.2, 0.3):
+        stats.record("create_task", seconds)
+    stats.record_error("description")
+
+    summary = stats.summarize(seconds=3.0)
+    baseline = {"steps": {
+        "create_task": {"p95_ms": 200.0, "errors": 0},
+        "description": {"p95_ms": 0.0, "errors": 1},
+    }}
+
+    assert summary["steps_completed"] == 3
+    assert summary["steps"]["create_task"]["p50_ms"] == pytest.approx(200.0)
+    assert find_regressions(summary, baseline, tolerance=0.2) == ["create_task: p95 200.0 ms -> 300.0 ms"]
+    assert find_regressions(summary, baseline, tolerance=0.5) == []
+
+    warming_up = LatencyStats(measure_from=float("inf"))
+    warming_up.record("create_task", 0.1)
+    assert warming_up.summarize(seconds=1.0)["steps"] == {}
+
+
+def test_status_change_waits_for_the_list_or_not_found_answer():
+    assert status_changed("sendPhoto", {})
+    assert status_changed("answerCallbackQuery", {"text": TASK_NOT_FOUND_MESSAGE})
+    assert not status_changed("answerCallbackQuery", {"text": "Задача выполнена, так держать!"})
+    assert not status_changed("deleteMessage", {})
+
+
+@pytest.mark.asyncio
+async def test_bot_talks_to_the_fake_api(unused_tcp_port):
+    api = FakeBotApi()
+    server = api.listen(unused_tcp_port)
+    base_url = f"http://127.0.0.1:{unused_tcp_port}"
+    try:
+        async with Bot("123456:benchmark", base_url=f"{base_url}/bot", base_file_url=f"{base_url}/file/bot") as bot:
+            await api.deliver({"message": {
+                "message_id": api.next_message_id(42),
+                "date": 0,
+                "chat": {"id": 42, "type": "private"},
+                "text": "/start",
+            }})
+            updates = await bot.get_updates(timeout=1)
+            assert [update.message.text for update in updates] == ["/start"]
+
+            reply = api.expect(42, lambda method, params: method == "sendPhoto")
+            answer = api.expect(42, lambda method, params: method == "answerCallbackQuery")
+            message = await bot.send_photo(
+                42,
+                b"photo",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🛏 Застелить кровать", callback_data="7")]]),
+            )
+            await bot.answer_callback_query("42:1", text="Готово")
+    finally:
+        api.close()
+        server.stop()
+
+    method, params, result = await reply
+    assert message.message_id == 2
+    assert params["reply_markup"]["inline_keyboard"][0][0]["callback_data"] == "7"
+    assert result["photo"][0]["file_id"] == message.photo[-1].file_id
+    assert (await answer)[1]["text"] == "Готово"
+
+
+@pytest.mark.asyncio
+async def test_stub_model_answers_single_and_batch_prompts():
+    model = StubModel(latency=0)
+
+    single = await model.run([GENERATE_EMOJI_PROMPT, {"role": "user", "text": "Застелить кровать"}])
+    batch = await model.run([GENERATE_EMOJIS_BATCH_PROMPT, {"role": "user", "text": "1. Застелить кровать\n2. Потянуться"}])
+
+    assert len(single.alternatives[0].text.splitlines()) == 1
+    assert [line.split(". ")[0] for line in batch.alternatives[0].text.splitlines()] == ["1", "2"]
@@ -3,18 +3,23 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock
 from sqlalchemy import select
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
 
 from src.bot import change_task_status_button_callback, description, start, create_task, get_list_tasks, task_button_callback
+from src.bot import back_to_list_button_callback, build_tasks_keyboard, fill_task_emoji
 from src.bot import CreateTaskConversation
 from src.messages import (
     START_MESSAGE,
     ALL_TASKS_COMPLETED_MESSAGE,
     TOO_MANY_TASKS_MESSAGE,
     NO_TASKS_FOUND_MESSAGE,
+    TASK_NOT_FOUND_MESSAGE,
 )
 from src.models import User, Task
-from src.task_manager import TaskManager
+from src.models.task import TaskStatus
+from src.task_manager import PLACEHOLDER_EMOJI, TaskManager
+from tests.conftest import test_engine
 
 
 @pytest.fixture
@@ -54,7 +59,7 @@ async def test_create_task_command_limit_reached(update, context, mocker):
     task_manager_mock = AsyncMock()
     task_manager_mock.get_task_count.return_value = 5  # Simulate reaching task limit
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
 
     result = await create_task(update, context)
@@ -71,7 +76,7 @@ async def test_get_list_tasks_empty(update, context, mocker):
     task_manager_mock = AsyncMock()
     task_manager_mock.get_pending_user_tasks.return_value = []  # Return empty task list
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
 
     await get_list_tasks(update, context)
@@ -88,7 +93,7 @@ async def test_create_task_success(update, context, mocker):
     tasks_list_mock = AsyncMock()
     task_manager_mock.get_task_count.return_value = 2  # Below limit
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
     mocker.patch('src.bot.get_list_tasks', return_value=tasks_list_mock)
 
@@ -115,7 +120,7 @@ async def test_task_button_callback(update, context, mocker):
     task_manager_mock = AsyncMock()
     task_manager_mock.get_task.return_value = MagicMock(description="Test task")
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
 
     await task_button_callback(update, context)
@@ -126,6 +131,55 @@ async def test_task_button_callback(update, context, mocker):
     context.bot.send_message.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_task_button_callback_reads_task_before_commit(setup_test_db, test_session, update, context, mocker):
+    # a real update session, it expires loaded objects when it commits
+    mocker.patch('src.database.get_engine', return_value=test_engine)
+    test_session.add(User(telegram_id=12345))
+    task = Task(user_id=12345, username="test_user", description="Застелить кровать", emoji="🛏")
+    test_session.add(task)
+    await test_session.flush()
+    task_id = task.id
+    await test_session.commit()
+
+    update.callback_query = AsyncMock()
+    update.callback_query.data = str(task_id)
+
+    await task_button_callback(update, context)
+
+    assert "Застелить кровать" in context.bot.send_message.call_args.kwargs["text"]
+
+
+@pytest.mark.asyncio
+async def test_no_connection_is_held_while_telegram_is_called(setup_test_db, test_session, update, context, mocker):
+    mocker.patch('src.database.get_engine', return_value=test_engine)
+    test_session.add(User(telegram_id=12345, list_message_id=5))
+    tasks = [Task(user_id=12345, username="test_user", description=f"Task {i}", emoji="🐸") for i in range(2)]
+    test_session.add_all(tasks)
+    await test_session.flush()
+    task_id = tasks[0].id
+    await test_session.commit()
+
+    checked_out = []
+
+    async def telegram_call(*args, **kwargs):
+        # like a request held up by the rate limiter, while the handler's queries are done meanwhile
+        await asyncio.sleep(0.05)
+        checked_out.append(test_engine.pool.checkedout())
+        return MagicMock(message_id=10, photo=[MagicMock(file_id="list-photo")])
+
+    update.callback_query = AsyncMock()
+    update.callback_query.data = f"complete_{task_id}"
+    update.callback_query.answer.side_effect = telegram_call
+    for method in ("send_photo", "edit_message_caption", "delete_message"):
+        getattr(context.bot, method).side_effect = telegram_call
+
+    await change_task_status_button_callback(update, context)
+
+    assert checked_out and set(checked_out) == {0}
+    assert (await test_session.get(Task, task_id)).status == TaskStatus.COMPLETED
+
+
 @pytest.mark.asyncio
 async def test_delete_last_tasks_list_message(update, context, mocker):
     user_mock = AsyncMock()
@@ -136,7 +190,7 @@ async def test_delete_last_tasks_list_message(update, context, mocker):
     
     task_manager_mock = AsyncMock()
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
 
     await get_list_tasks(update, context)
@@ -156,7 +210,7 @@ async def test_delete_last_task(update, context, mocker):
     task_manager_mock = AsyncMock()
     task_manager_mock.get_task.return_value = MagicMock(description="Test task")
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
 
     await task_button_callback(update, context)
@@ -166,7 +220,7 @@ async def test_delete_last_task(update, context, mocker):
     context.bot.delete_message.assert_called_once()
 
     update.callback_query.data = "complete_123"
-    task_manager_mock.get_task_count.return_value = 0
+    task_manager_mock.change_task_status.return_value = []
 
     await change_task_status_button_callback(update, context)
 
@@ -182,7 +236,7 @@ async def test_delete_last_tasks_list_message_after_task_created(update, context
     update_user_list_message_id_mock = AsyncMock()
     user_mock = AsyncMock()
     
-    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
     mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
     mocker.patch('src.bot.update_user_list_message_id', update_user_list_message_id_mock)
 
@@ -221,6 +275,7 @@ async def test_delete_last_tasks_list_message_after_task_created(update, context
 @pytest.mark.asyncio
 async def test_task_updated_at_changes(setup_test_db, test_session, mocker):
     llm_service_mock = AsyncMock()
+    llm_service_mock.suggest_local_emoji.return_value = None
     llm_service_mock.generate_task_emoji.return_value = "🐸"
     mocker.patch('src.task_manager.llm_service', llm_service_mock)
 
@@ -245,7 +300,194 @@ async def test_task_updated_at_changes(setup_test_db, test_session, mocker):
 
     await asyncio.sleep(1)
 
-    await task_manager.change_task_status(task.id, "complete")
+    await task_manager.change_task_status(task.id, "complete", 12345)
     await test_session.refresh(task)
 
     assert task.updated_at > initial_updated_at
+
+
+@pytest.mark.asyncio
+async def test_change_task_status_reuses_pending_tasks(update, context, mocker):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "complete_123"
+
+    session_mock = AsyncMock()
+    session_mock.get.return_value = None
+    task_manager_mock = AsyncMock()
+    task = MagicMock(id=1, emoji="🐸", description="Test task")
+    task_manager_mock.change_task_status.return_value = [task]
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+    mocker.patch('src.bot.update_user_list_message_id', AsyncMock())
+
+    await change_task_status_button_callback(update, context)
+
+    task_manager_mock.change_task_status.assert_called_once_with(123, "complete", 12345)
+    task_manager_mock.get_pending_user_tasks.assert_not_called()
+    task_manager_mock.get_task_count.assert_not_called()
+    context.bot.send_photo.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_description_fills_emoji_in_background(update, context, mocker):
+    session_mock = AsyncMock()
+    task_manager_mock = AsyncMock()
+    task_manager_mock.create_task.return_value = 7
+    fill_task_emoji_mock = MagicMock()
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+    mocker.patch('src.bot.get_list_tasks', AsyncMock(return_value=MagicMock(message_id=42)))
+    mocker.patch('src.bot.fill_task_emoji', fill_task_emoji_mock)
+    mocker.patch('src.bot.get_settings', return_value=MagicMock(generate_emoji_in_background=True))
+
+    update.message.text = "test_description"
+    result = await description(update, context)
+
+    assert result == ConversationHandler.END
+    assert task_manager_mock.create_task.call_args.kwargs["emoji"] == PLACEHOLDER_EMOJI
+    context.application.create_task.assert_called_once()
+    assert fill_task_emoji_mock.call_args.kwargs["task_id"] == 7
+    assert fill_task_emoji_mock.call_args.kwargs["list_message_id"] == 42
+
+
+@pytest.mark.asyncio
+async def test_fill_task_emoji_refreshes_list_markup(context, mocker):
+    session_mock = AsyncMock()
+    task_manager_mock = AsyncMock()
+    task_manager_mock.get_pending_user_tasks.return_value = [MagicMock(id=7, emoji="🐸", description="Test task")]
+
+    session_mock.get.return_value = User(telegram_id=12345, list_message_id=42)
+
+    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+
+    await fill_task_emoji(context, chat_id=1, user_id=12345, task_id=7, description="Test task", list_message_id=42)
+
+    task_manager_mock.fill_task_emoji.assert_called_once_with(7, "Test task")
+    context.bot.edit_message_reply_markup.assert_called_once()
+    assert context.bot.edit_message_reply_markup.call_args.args[:2] == (1, 42)
+
+
+@pytest.fixture
+def edit_in_place(mocker):
+    mocker.patch('src.bot.get_settings', return_value=MagicMock(edit_list_in_place=True, generate_emoji_in_background=False))
+
+
+@pytest.mark.asyncio
+async def test_task_button_edits_list_in_place(update, context, mocker, edit_in_place):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "123"
+    update.callback_query.message.message_id = 10
+
+    task_manager_mock = AsyncMock()
+    task_manager_mock.get_task.return_value = MagicMock(description="Test task")
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=AsyncMock())))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+
+    await task_button_callback(update, context)
+
+    context.bot.edit_message_caption.assert_called_once()
+    assert context.bot.edit_message_caption.call_args.args[1] == 10
+    context.bot.send_message.assert_not_called()
+    context.bot.delete_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_fill_task_emoji_leaves_task_card_alone(update, context, mocker, edit_in_place):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "123"
+    update.callback_query.message.message_id = 10
+
+    session_mock = AsyncMock()
+    session_mock.get.return_value = User(telegram_id=12345, list_message_id=10)
+    task_manager_mock = AsyncMock()
+    task_manager_mock.get_task.return_value = MagicMock(description="Test task")
+    task_manager_mock.get_pending_user_tasks.return_value = [MagicMock(id=7, emoji="🐸", description="Test task")]
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+
+    # the list message 10 becomes a task card before the emoji of a new task is ready
+    await task_button_callback(update, context)
+    await fill_task_emoji(context, chat_id=1, user_id=12345, task_id=7, description="Test task", list_message_id=10)
+
+    task_manager_mock.fill_task_emoji.assert_called_once_with(7, "Test task")
+    context.bot.edit_message_reply_markup.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_back_to_list_edits_list_in_place(update, context, mocker, edit_in_place):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "back_to_list"
+    update.callback_query.message.message_id = 10
+
+    session_mock = AsyncMock()
+    session_mock.get.return_value = None
+    task_manager_mock = AsyncMock()
+    task_manager_mock.get_pending_user_tasks.return_value = [MagicMock(id=1, emoji="🐸", description="Test task")]
+    update_user_list_message_id_mock = AsyncMock()
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+    mocker.patch('src.bot.update_user_list_message_id', update_user_list_message_id_mock)
+
+    await back_to_list_button_callback(update, context)
+
+    context.bot.edit_message_caption.assert_called_once()
+    assert context.bot.edit_message_caption.call_args.kwargs["caption"] is None
+    context.bot.send_photo.assert_not_called()
+    context.bot.delete_message.assert_not_called()
+    assert update_user_list_message_id_mock.call_args.args[3] == 10
+
+
+@pytest.mark.asyncio
+async def test_not_editable_message_falls_back_to_new_list(update, context, mocker, edit_in_place):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "back_to_list"
+
+    session_mock = AsyncMock()
+    session_mock.get.return_value = None
+    task_manager_mock = AsyncMock()
+    task_manager_mock.get_pending_user_tasks.return_value = [MagicMock(id=1, emoji="🐸", description="Test task")]
+    context.bot.edit_message_caption.side_effect = BadRequest("There is no caption in the message to edit")
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session_mock)))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+    mocker.patch('src.bot.update_user_list_message_id', AsyncMock())
+
+    await back_to_list_button_callback(update, context)
+
+    context.bot.send_photo.assert_called_once()
+    context.bot.delete_message.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_change_status_of_missing_task_only_answers(update, context, mocker):
+    update.callback_query = AsyncMock()
+    update.callback_query.data = "delete_123"
+    task_manager_mock = AsyncMock()
+    task_manager_mock.change_task_status.return_value = None
+    get_list_tasks_mock = mocker.patch('src.bot.get_list_tasks', AsyncMock())
+
+    mocker.patch('src.bot.get_update_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=AsyncMock())))
+    mocker.patch('src.bot.TaskManager', return_value=task_manager_mock)
+
+    await change_task_status_button_callback(update, context)
+
+    update.callback_query.answer.assert_called_once_with(TASK_NOT_FOUND_MESSAGE)
+    get_list_tasks_mock.assert_not_called()
+    context.bot.send_message.assert_not_called()
+    context.bot.delete_message.assert_not_called()
+
+
+def test_jumped_tasks_are_marked_in_the_list():
+    keyboard = build_tasks_keyboard([
+        Task(id=1, user_id=12345, username="test_user", description="Застелить кровать", emoji="🛏"),
+        Task(id=2, user_id=12345, username="test_user", description="Потянуться", emoji="🧘", jumps=2),
+    ])
+
+    assert [row[0].text for row in keyboard.inline_keyboard] == ["🛏 Застелить кровать", "🧘 Потянуться 🐸×2"]
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+from unittest.mock import AsyncMock
+from sqlmodel import select
+from telegram.error import Forbidden
+
+from src.broadcast import ReminderBroadcaster
+from src.models import ReminderBroadcast, User
+from src.rate_limiter import Priority
+from tests.conftest import get_test_session
+
+
+DAY = date(2025, 2, 19)
+
+
+@pytest.fixture
+def broadcast_db(mocker):
+    mocker.patch('src.broadcast.get_session', side_effect=get_test_session)
+
+
+@pytest.fixture
+def bot():
+    bot = AsyncMock()
+
+    async def send_message(chat_id, *args, **kwargs):
+        if chat_id == 5:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+
+    bot.send_message.side_effect = send_message
+    return bot
+
+
+def _broadcaster(bot, **kwargs) -> ReminderBroadcaster:
+    return ReminderBroadcaster(bot, DAY, workers=3, rate=1000, segment_size=4, checkpoint_interval=0.01, **kwargs)
+
+
+def _recipients(bot) -> list[int]:
+    return sorted(call.args[0] for call in bot.send_message.call_args_list)
+
+
+async def _add_users(session) -> None:
+    session.add_all([User(telegram_id=user_id) for user_id in range(1, 11)])
+    session.add(User(telegram_id=11, blocked_at=datetime(2025, 2, 1, tzinfo=timezone.utc)))
+    await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_reminder_is_sent_once_and_blocked_users_are_recorded(setup_test_db, test_session, broadcast_db, bot):
+    await _add_users(test_session)
+
+    report = await _broadcaster(bot).run()
+
+    assert _recipients(bot) == list(range(1, 11))
+    assert all(call.kwargs["rate_limit_args"] == Priority.BROADCAST for call in bot.send_message.call_args_list)
+    assert (report.sent, report.blocked, report.failed) == (9, 1, 0)
+
+    checkpoint = await test_session.get(ReminderBroadcast, DAY)
+    assert (checkpoint.last_user_id, checkpoint.sent, checkpoint.blocked) == (10, 9, 1)
+    assert checkpoint.finished_at is not None
+    assert checkpoint.claimed_until is None
+    blocked = (await test_session.scalars(select(User.telegram_id).where(User.blocked_at.is_not(None)))).all()
+    assert sorted(blocked) == [5, 11]
+
+    assert await _broadcaster(bot).run() is None
+    assert bot.send_message.call_count == 10
+
+
+@pytest.mark.asyncio
+async def test_stopped_broadcast_resumes_after_checkpoint(setup_test_db, test_session, broadcast_db, bot):
+    await _add_users(test_session)
+    sent = asyncio.Event()
+    release = asyncio.Event()
+
+    async def send_message(chat_id, *args, **kwargs):
+        if chat_id > 3:
+            sent.set()
+            await release.wait()
+
+    bot.send_message.side_effect = send_message
+    run = asyncio.create_task(_broadcaster(bot).run())
+    await sent.wait()
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+
+    checkpoint = await test_session.get(ReminderBroadcast, DAY)
+    assert checkpoint.last_user_id == 3
+    assert checkpoint.sent == 3
+    assert checkpoint.finished_at is None
+
+    # a resume doesn't start a broadcast of a day that had none
+    assert await ReminderBroadcaster(AsyncMock(), date(2025, 2, 20)).run(resume_only=True) is None
+
+    resumed = AsyncMock()
+    report = await _broadcaster(resumed).run(resume_only=True)
+
+    assert _recipients(resumed) == list(range(4, 11))
+    assert report.sent == 7
+
+
+@pytest.mark.asyncio
+async def test_claimed_broadcast_is_not_sent_twice(setup_test_db, test_session, broadcast_db, bot):
+    await _add_users(test_session)
+    blocking = asyncio.Event()
+
+    async def send_message(chat_id, *args, **kwargs):
+        await blocking.wait()
+
+    bot.send_message.side_effect = send_message
+    first = asyncio.create_task(_broadcaster(bot).run())
+    await asyncio.sleep(0.1)
+
+    other = AsyncMock()
+    assert await _broadcaster(other).run() is None
+    other.send_message.assert_not_called()
+
+    blocking.set()
+    assert (await first).sent == 10
+
+
+@pytest.mark.asyncio
+async def test_cancelled_checkpoint_keeps_its_counts(setup_test_db, test_session, broadcast_db, bot, mocker):
+    await _add_users(test_session)
+    broadcaster = _broadcaster(bot)
+    assert await broadcaster._claim(resume_only=False)
+    broadcaster._sent, broadcaster._blocked, broadcaster._blocked_ids = 3, 1, [5]
+
+    writing = asyncio.Event()
+
+    async def stalled_execute(*args, **kwargs):
+        writing.set()
+        await asyncio.Event().wait()
+
+    session = AsyncMock(execute=AsyncMock(side_effect=stalled_execute))
+    mocker.patch('src.broadcast.get_session', return_value=AsyncMock(__aenter__=AsyncMock(return_value=session)))
+    checkpoint = asyncio.create_task(broadcaster._save_checkpoint())
+    await writing.wait()
+    checkpoint.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await checkpoint
+
+    assert (broadcaster._sent, broadcaster._blocked, broadcaster._blocked_ids) == (3, 1, [5])
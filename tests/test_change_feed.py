@@ -0,0 +1,73 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+from src.change_feed import ChangeFeed
+from src.models import Task, User
+from tests.conftest import TEST_DB_URL, test_engine
+
+MIGRATION = Path(__file__).parent.parent / "migrations" / "versions" / "c4e8a1f5d203_add_change_feed_triggers.py"
+
+
+async def _apply_migration(mocker) -> None:
+    spec = importlib.util.spec_from_file_location("change_feed_migration", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    statements = []
+    mocker.patch.object(migration, "op", mocker.Mock(execute=statements.append))
+    migration.upgrade()
+    async with test_engine.begin() as conn:
+        for statement in statements:
+            await conn.execute(text(statement))
+
+
+@pytest.fixture
+def feed(mocker):
+    mocker.patch("src.change_feed.get_settings", return_value=mocker.Mock(db_url=TEST_DB_URL, db_connect_args={}))
+    return ChangeFeed(reconnect_delay=0.01)
+
+
+def test_dispatch_routes_changes_by_table(feed, mocker):
+    on_task_change = mocker.Mock()
+    feed.subscribe("tasks", on_task_change, mocker.Mock())
+
+    feed.dispatch('{"table": "tasks", "user_id": 42}')
+    feed.dispatch('{"table": "users", "user_id": 42}')
+    feed.dispatch("not json")
+
+    on_task_change.assert_called_once_with(42)
+
+
+@pytest.mark.asyncio
+async def test_task_changes_are_received_from_the_database(setup_test_db, test_session, feed, mocker):
+    await _apply_migration(mocker)
+    changes = asyncio.Queue()
+    on_resync = mocker.Mock()
+    feed.subscribe("tasks", changes.put_nowait, on_resync)
+    user_changes = mocker.Mock()
+    feed.subscribe("users", user_changes, on_resync)
+    feed.start()
+    try:
+        await asyncio.wait_for(feed.connected.wait(), timeout=5)
+        on_resync.assert_called_once()
+
+        test_session.add(User(telegram_id=12345))
+        await test_session.commit()
+        test_session.add_all([
+            Task(user_id=12345, username="test_user", description="Task 1", emoji="🐸"),
+            Task(user_id=12345, username="test_user", description="Task 2", emoji="🐸"),
+        ])
+        await test_session.commit()
+
+        # the user's row was written first, but only tasks notify
+        assert await asyncio.wait_for(changes.get(), timeout=5) == 12345
+        user_changes.assert_not_called()
+        # identical notifications of one transaction are delivered once
+        await asyncio.sleep(0.1)
+        assert changes.empty()
+    finally:
+        await feed.stop()
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import select
+
+from src.database import get_update_session
+from src.models import User, Task
+from src.task_manager import TaskManager
+from tests.conftest import get_test_session, test_engine
+
+
+@pytest.mark.asyncio
+async def test_update_session_is_shared_and_committed_once(setup_test_db, mocker):
+    mocker.patch('src.database.get_engine', return_value=test_engine)
+    context = SimpleNamespace()
+
+    async with get_update_session(context) as session:
+        session.add(User(telegram_id=12345))
+        await TaskManager(session).create_task(12345, "test_user", "Test task", emoji="🐸")
+
+        async with get_update_session(context) as nested_session:
+            assert nested_session is session
+
+        # nested exit doesn't commit, the task is still invisible to other sessions
+        async with get_test_session() as other_session:
+            assert (await other_session.execute(select(Task))).first() is None
+
+    assert context.db_session is None
+    async with get_test_session() as other_session:
+        task = (await other_session.execute(select(Task))).scalar_one()
+        assert task.description == "Test task"
+
+
+@pytest.mark.asyncio
+async def test_update_session_is_rolled_back_on_error(setup_test_db, mocker):
+    mocker.patch('src.database.get_engine', return_value=test_engine)
+    context = SimpleNamespace()
+
+    with pytest.raises(RuntimeError):
+        async with get_update_session(context) as session:
+            session.add(User(telegram_id=12345))
+            await session.flush()
+            raise RuntimeError("handler failed")
+
+    assert context.db_session is None
+    async with get_test_session() as other_session:
+        assert (await other_session.execute(select(User))).first() is None
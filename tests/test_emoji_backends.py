@@ -0,0 +1,56 @@
+import pytest
+
+from src.emoji_backends import KeywordEmojiBackend
+
+
+@pytest.fixture(scope="module")
+def backend():
+    return KeywordEmojiBackend.from_assets()
+
+
+@pytest.mark.parametrize("description, emoji", [
+    ("Позвонить по телефону", "📞"),
+    ("Застелить кровать", "🛏"),
+    ("Разобрать рабочий стол", "🗂"),
+    ("Прочитать 1 страницу книги", "📖"),
+    ("Покормить кота", "🐱"),
+    ("Выпить стакан воды", "💧"),
+])
+def test_everyday_tasks_are_matched_confidently(backend, description, emoji):
+    assert backend.match(description) == (emoji, 1.0)
+
+
+@pytest.mark.parametrize("description", [
+    "Пожарить котлеты",
+    "Сходить в столовую",
+    "Главное не забыть паспорт",
+])
+def test_short_stems_do_not_match_longer_words(backend, description):
+    assert backend.match(description) == ("", 0.0)
+
+
+def test_unmatched_words_lower_confidence():
+    backend = KeywordEmojiBackend({"📞": ["звонок", "телефон"]})
+
+    assert backend.match("Сделать тот самый важный телефонный звонок") == ("📞", 2 / 6)
+    # prepositions and numbers don't count
+    assert backend.match("Звонок по телефону в 5") == ("📞", 1.0)
+
+
+def test_unknown_task_has_no_confidence(backend):
+    assert backend.match("Сделать что-нибудь") == ("", 0.0)
+
+
+def test_ambiguous_task_has_low_confidence():
+    backend = KeywordEmojiBackend({"📖": ["книгу"], "🛒": ["купит"]})
+
+    emoji, confidence = backend.match("Купить книгу")
+
+    assert emoji in ("📖", "🛒")
+    assert confidence == 0.5
+
+
+def test_longest_stem_wins():
+    backend = KeywordEmojiBackend({"🚗": ["машин"], "🧺": ["машинк"]})
+
+    assert backend.match("Стиральная машинка")[0] == "🧺"
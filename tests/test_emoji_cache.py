@@ -0,0 +1,60 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from src.emoji_cache import EmojiCache, normalize_description
+from src.metrics import EMOJI_CACHE_LOOKUPS
+from tests.conftest import test_engine
+
+
+def test_normalize_description():
+    assert normalize_description("  Застелить   КРОВАТЬ!! ") == "застелить кровать"
+    assert normalize_description("Потянуться, 5 минут.") == "потянуться 5 минут"
+    assert normalize_description("Прочитать 1 страницу книги") == normalize_description("прочитать 1 страницу  книги…")
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_is_bounded(setup_test_db):
+    generate = AsyncMock(side_effect=lambda description: description[0])
+    cache = EmojiCache(max_size=2)
+    lookups = {result: EMOJI_CACHE_LOOKUPS.labels(result).value for result in ("memory_hit", "db_hit", "miss")}
+
+    await cache.get_or_generate("a", generate)
+    await cache.get_or_generate("b", generate)
+    await cache.get_or_generate("A!", generate)
+    await cache.get_or_generate("c", generate)
+
+    # "b" was the least recently used entry, it's found in the table now
+    assert cache.stats == {"memory_hits": 1, "db_hits": 0, "misses": 3, "size": 2}
+    await cache.get_or_generate("b", generate)
+    assert cache.stats == {"memory_hits": 1, "db_hits": 1, "misses": 3, "size": 2}
+    assert {result: EMOJI_CACHE_LOOKUPS.labels(result).value - value for result, value in lookups.items()} == {
+        "memory_hit": 1, "db_hit": 1, "miss": 3,
+    }
+
+
+@pytest.mark.asyncio
+async def test_cache_survives_restart(setup_test_db):
+    generate = AsyncMock(return_value="🛏")
+
+    cache = EmojiCache(max_size=16)
+    assert await cache.get_or_generate("Застелить кровать", generate) == "🛏"
+
+    restarted_cache = EmojiCache(max_size=16)
+    assert await restarted_cache.get_or_generate("застелить кровать!", generate) == "🛏"
+    assert await restarted_cache.get_or_generate("Застелить  кровать", generate) == "🛏"
+
+    generate.assert_called_once()
+    assert restarted_cache.stats == {"memory_hits": 1, "db_hits": 1, "misses": 0, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_no_connection_is_held_while_generating(setup_test_db):
+    checked_out = []
+
+    async def generate(description):
+        checked_out.append(test_engine.pool.checkedout())
+        return "🛏"
+
+    await EmojiCache(max_size=16).get_or_generate("Застелить кровать", generate)
+
+    assert checked_out == [0]
@@ -0,0 +1,265 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.emoji_backends import EmojiBackend, KeywordEmojiBackend
+from src.llm_service import (
+    GENERATE_EMOJIS_BATCH_PROMPT,
+    CircuitOpenError,
+    EmojiGenerationError,
+    LLMService,
+    YandexGPTBackend,
+    is_emoji,
+)
+
+
+def model_response(text: str) -> MagicMock:
+    return MagicMock(alternatives=[MagicMock(text=text)])
+
+
+@pytest.fixture
+def service():
+    service = YandexGPTBackend(
+        batch_window_ms=20,
+        max_batch_size=3,
+        max_concurrency=2,
+        request_timeout=0.2,
+        failure_threshold=2,
+        recovery_timeout=0.1,
+    )
+    service.model = AsyncMock()
+    return service
+
+
+@pytest.mark.asyncio
+async def test_identical_descriptions_share_request(service):
+    service.model.run.return_value = model_response("🛏")
+
+    emojis = await asyncio.gather(*(service.generate_task_emoji("Застелить кровать") for _ in range(3)))
+
+    assert emojis == ["🛏", "🛏", "🛏"]
+    service.model.run.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_descriptions_within_window_are_batched(service):
+    service.model.run.return_value = model_response("1. 🛏\n2. 🧘\n")
+
+    emojis = await asyncio.gather(
+        service.generate_task_emoji("Застелить кровать"),
+        service.generate_task_emoji("Потянуться 5 минут"),
+    )
+
+    assert emojis == ["🛏", "🧘"]
+    service.model.run.assert_called_once()
+    messages = service.model.run.call_args.args[0]
+    assert messages[0] == GENERATE_EMOJIS_BATCH_PROMPT
+    assert messages[1]["text"] == "1. Застелить кровать\n2. Потянуться 5 минут"
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_without_waiting(service):
+    service.batch_window = 60
+    service.model.run.return_value = model_response("🛏\n🧘\n📚")
+
+    emojis = await asyncio.wait_for(
+        asyncio.gather(*(service.generate_task_emoji(description) for description in "abc")),
+        timeout=1,
+    )
+
+    assert emojis == ["🛏", "🧘", "📚"]
+
+
+@pytest.mark.asyncio
+async def test_malformed_batch_falls_back_to_single_requests(service):
+    service.model.run.side_effect = [
+        model_response("🛏🧘"),
+        model_response("🛏"),
+        model_response("🧘"),
+    ]
+
+    emojis = await asyncio.gather(
+        service.generate_task_emoji("Застелить кровать"),
+        service.generate_task_emoji("Потянуться 5 минут"),
+    )
+
+    assert emojis == ["🛏", "🧘"]
+    assert service.model.run.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_lines_that_are_not_emojis_fall_back_to_single_requests(service):
+    service.model.run.side_effect = [
+        model_response("1. 🛏\n2. Конечно! Вот эмодзи для растяжки: 🧘"),
+        model_response("🛏"),
+        model_response("🧘"),
+    ]
+
+    emojis = await asyncio.gather(
+        service.generate_task_emoji("Застелить кровать"),
+        service.generate_task_emoji("Потянуться 5 минут"),
+    )
+
+    assert emojis == ["🛏", "🧘"]
+    assert service.model.run.call_count == 3
+
+
+def test_is_emoji():
+    assert all(is_emoji(text) for text in ("🛏", "❤️", "👍🏽", "👨‍👩‍👧", "🇷🇺", "1️⃣"))
+    assert not any(is_emoji(text) for text in ("", "1", "кот", "🛏 кровать", "🛏" * 9))
+
+
+@pytest.mark.asyncio
+async def test_failure_is_propagated_to_every_caller(service):
+    service.model.run.side_effect = RuntimeError("YandexGPT is unavailable")
+
+    results = await asyncio.gather(
+        service.generate_task_emoji("a"),
+        service.generate_task_emoji("a"),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not service._in_flight
+
+
+@pytest.mark.asyncio
+async def test_slow_model_call_times_out(service):
+    async def slow_run(messages):
+        await asyncio.sleep(1)
+
+    service.model.run.side_effect = slow_run
+
+    with pytest.raises(asyncio.TimeoutError):
+        await service.generate_task_emoji("a")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_model_calls_are_limited(service):
+    running = 0
+    max_running = 0
+
+    async def run(messages):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return model_response("🐸")
+
+    service.max_batch_size = 1
+    service.model.run.side_effect = run
+
+    await asyncio.gather(*(service.generate_task_emoji(str(i)) for i in range(6)))
+
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_and_recovers(service):
+    service.model.run.side_effect = RuntimeError("YandexGPT is unavailable")
+
+    for description in ("a", "b"):
+        with pytest.raises(RuntimeError):
+            await service.generate_task_emoji(description)
+
+    assert service.circuit_breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        await service.generate_task_emoji("c")
+    assert service.model.run.call_count == 2
+
+    await asyncio.sleep(0.1)
+    service.model.run.side_effect = None
+    service.model.run.return_value = model_response("🐸")
+
+    assert await service.generate_task_emoji("d") == "🐸"
+    assert not service.circuit_breaker.is_open
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_request_does_not_keep_circuit_open(service):
+    service.model.run.side_effect = RuntimeError("YandexGPT is unavailable")
+    for description in ("a", "b"):
+        with pytest.raises(RuntimeError):
+            await service.generate_task_emoji(description)
+    await asyncio.sleep(0.1)
+
+    started = asyncio.Event()
+
+    async def stalled_run(messages):
+        started.set()
+        await asyncio.Event().wait()
+
+    service.model.run.side_effect = stalled_run
+    trial = asyncio.create_task(service._run_model([]))
+    await started.wait()
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+
+    assert not service.circuit_breaker.is_open
+    service.model.run.side_effect = None
+    service.model.run.return_value = model_response("🐸")
+    assert await service.generate_task_emoji("c") == "🐸"
+
+
+class StaticBackend(EmojiBackend):
+    is_local = True
+
+    def __init__(self, emoji: str, confidence: float, error: Exception | None = None):
+        self.emoji = emoji
+        self.confidence = confidence
+        self.error = error
+        self.calls = 0
+
+    async def suggest_emoji(self, description: str) -> tuple[str, float]:
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.emoji, self.confidence
+
+
+@pytest.mark.asyncio
+async def test_confident_local_backend_skips_remote():
+    local, remote = StaticBackend("🛏", 1.0), StaticBackend("🐸", 1.0)
+    service = LLMService([local, remote], min_confidence=0.6, fallback_emoji="🐸")
+
+    assert await service.generate_task_emoji("Застелить кровать") == "🛏"
+    assert remote.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_low_confidence_falls_through_to_remote():
+    local, remote = StaticBackend("📖", 0.5), StaticBackend("🛒", 1.0)
+    service = LLMService([local, remote], min_confidence=0.6, fallback_emoji="🐸")
+
+    assert await service.generate_task_emoji("Купить книгу") == "🛒"
+
+
+@pytest.mark.asyncio
+async def test_remote_failure_is_raised_instead_of_low_confidence_guess():
+    local = StaticBackend("📖", 0.5)
+    remote = StaticBackend("", 0.0, error=CircuitOpenError("open"))
+    service = LLMService([local, remote], min_confidence=0.6, fallback_emoji="🐸")
+
+    with pytest.raises(EmojiGenerationError) as error:
+        await service.generate_task_emoji("Купить книгу")
+    assert isinstance(error.value.__cause__, CircuitOpenError)
+
+
+@pytest.mark.asyncio
+async def test_local_only_service_returns_best_guess_or_fallback():
+    service = LLMService([KeywordEmojiBackend({"📖": ["прочит", "книгу"]})], min_confidence=0.6, fallback_emoji="🐸")
+
+    assert await service.generate_task_emoji("Прочитать книгу") == "📖"
+    assert await service.generate_task_emoji("Сделать что-нибудь") == "🐸"
+
+
+@pytest.mark.asyncio
+async def test_local_suggestion_ignores_remote_backends():
+    local, remote = StaticBackend("📖", 0.5), StaticBackend("🛒", 1.0)
+    remote.is_local = False
+    service = LLMService([local, remote], min_confidence=0.6, fallback_emoji="🐸")
+
+    assert await service.suggest_local_emoji("Купить книгу") is None
+    assert remote.calls == 0
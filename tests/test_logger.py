@@ -0,0 +1,61 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from src.logger import ColoredFormatter, ContextQueueHandler, JsonFormatter, log_context, log_handler
+from src.update_processor import PerUserUpdateProcessor
+from tests.test_update_processor import user_update
+
+
+def _record(message: str = "Created task %d", *args, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("todofrog", logging.INFO, "src/bot.py", 42, message, args or (7,), exc_info)
+
+
+def test_colored_formatter_leaves_the_record_as_is():
+    record = _record()
+
+    formatted = ColoredFormatter(use_colors=True, fmt='%(levelname)s | %(name)s | %(message)s').format(record)
+
+    assert "Created task 7" in formatted
+    assert "bot.py:42" in formatted
+    assert (record.levelname, record.name) == ("INFO", "todofrog")
+
+
+def test_records_carry_the_context_of_the_update_they_were_logged_for():
+    records = queue.SimpleQueue()
+    handler = ContextQueueHandler(records)
+    token = log_context.set({"user_id": 12345, "handler": "description"})
+    try:
+        raise ValueError("LLM is down")
+    except ValueError:
+        handler.handle(_record(exc_info=sys.exc_info()))
+    finally:
+        log_context.reset(token)
+
+    entry = json.loads(JsonFormatter().format(records.get_nowait()))
+
+    assert entry["message"] == "Created task 7"
+    assert entry["level"] == "INFO"
+    assert entry["location"] == "bot.py:42"
+    assert (entry["user_id"], entry["handler"]) == (12345, "description")
+    assert "ValueError: LLM is down" in entry["exception"]
+
+
+@pytest.mark.asyncio
+async def test_update_context_covers_the_handler():
+    seen = {}
+
+    @log_handler
+    async def description(update, context):
+        seen.update(log_context.get())
+
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    update = user_update(12345)
+    update.update_id = 1
+    await processor.process_update(update, description(update, None))
+
+    assert seen == {"update_id": 1, "user_id": 12345, "handler": "description"}
+    assert log_context.get() is None
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telegram.error import BadRequest
+
+from src.media_manager import get_file_id, send_cached_photo
+from src.models import TelegramFile
+
+
+@pytest.fixture
+def context():
+    context = MagicMock()
+    context.bot = AsyncMock()
+    context.bot.send_photo.return_value = MagicMock(photo=[MagicMock(file_id="small"), MagicMock(file_id="uploaded")])
+    return context
+
+
+@pytest.mark.asyncio
+async def test_photo_uploaded_once_then_sent_by_file_id(context):
+    session = AsyncMock()
+    session.get.return_value = None
+
+    await send_cached_photo(session, context, 1, "image.jpg", b"jpeg")
+    await send_cached_photo(session, context, 1, "image.jpg", b"jpeg")
+
+    assert context.bot.send_photo.call_args_list[0].args[1] == b"jpeg"
+    assert context.bot.send_photo.call_args_list[1].args[1] == "uploaded"
+    session.merge.assert_called_once()
+    session.get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_is_uploaded_again(context):
+    session = AsyncMock()
+    session.get.return_value = TelegramFile(name="image.jpg", file_id="stale")
+    context.bot.send_photo.side_effect = [
+        BadRequest("Wrong file identifier/http url specified"),
+        context.bot.send_photo.return_value,
+    ]
+
+    await send_cached_photo(session, context, 1, "image.jpg", b"jpeg")
+
+    assert context.bot.send_photo.call_args_list[0].args[1] == "stale"
+    assert context.bot.send_photo.call_args_list[1].args[1] == b"jpeg"
+    assert await get_file_id(session, "image.jpg") == "uploaded"
+
+
+@pytest.mark.asyncio
+async def test_file_id_survives_restart(setup_test_db, test_session, context, mocker):
+    await send_cached_photo(test_session, context, 1, "image.jpg", b"jpeg")
+
+    # a fresh process starts with an empty in-memory cache
+    mocker.patch.dict('src.media_manager._file_ids', clear=True)
+    test_session.expunge_all()
+
+    assert await get_file_id(test_session, "image.jpg") == "uploaded"
@@ -0,0 +1,175 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+import tornado.httpclient
+
+from src.database import TimedQueuePool, instrument_engine
+from src.llm_service import YandexGPTBackend
+from src.metrics import (
+    DB_POOL_CHECKOUT_WAIT,
+    DB_QUERY_ERRORS,
+    DB_QUERY_LATENCY,
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    LLM_ERRORS,
+    LLM_LATENCY,
+    UPDATES_IN_FLIGHT,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    Registry,
+    count_errors,
+    observe_handler,
+    start_metrics_server,
+)
+from src.update_processor import PerUserUpdateProcessor
+from tests.conftest import TEST_DB_URL
+from tests.test_update_processor import user_update
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("requests", "Handled requests", ("handler",)))
+    in_flight = registry.register(Gauge("in_flight", "Requests in flight"))
+    latency = registry.register(Histogram("latency_seconds", "Request latency", buckets=(0.1, 1.0)))
+
+    requests.labels('say "hi"\n').inc(2)
+    in_flight.inc()
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests Handled requests",
+        "# TYPE requests counter",
+        'requests_total{handler="say \\"hi\\"\\n"} 2.0',
+        "# HELP in_flight Requests in flight",
+        "# TYPE in_flight gauge",
+        "in_flight 1.0",
+        "# HELP latency_seconds Request latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1.0',
+        'latency_seconds_bucket{le="1.0"} 2.0',
+        'latency_seconds_bucket{le="+Inf"} 3.0',
+        "latency_seconds_sum 3.55",
+        "latency_seconds_count 3.0",
+    ]
+
+
+def test_labels_must_match_the_label_names():
+    with pytest.raises(ValueError):
+        Counter("requests", "Handled requests", ("handler",)).labels()
+
+
+def test_metric_types_must_render_samples():
+    class Untyped(Metric):
+        def _new_child(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Untyped("untyped", "A metric without samples")
+
+
+def test_function_gauge_is_read_when_rendered():
+    gauge = Gauge("checked_out", "Checked out connections", function=lambda: 3)
+
+    assert gauge.render().splitlines()[-1] == "checked_out 3.0"
+
+
+def test_labelled_function_gauge_renders_every_value():
+    gauge = Gauge("queue_depth", "Queued requests", ("priority",), function=lambda: {("reply",): 1, ("cleanup",): 4})
+
+    assert gauge.render().splitlines()[2:] == ['queue_depth{priority="reply"} 1.0', 'queue_depth{priority="cleanup"} 4.0']
+
+
+def test_errors_are_counted_by_class():
+    errors = Counter("errors", "Failed requests", ("endpoint", "error"))
+
+    with pytest.raises(TimeoutError), count_errors(errors, "sendMessage"):
+        raise TimeoutError
+
+    assert errors.labels("sendMessage", "TimeoutError").value == 1
+
+
+@pytest.mark.asyncio
+async def test_handler_latency_and_errors_are_recorded():
+    async def failing_handler(update, context):
+        raise ValueError("LLM is down")
+
+    handled = HANDLER_LATENCY.labels("failing_handler").count
+    failed = HANDLER_ERRORS.labels("failing_handler").value
+
+    with pytest.raises(ValueError):
+        await observe_handler(failing_handler)(None, None)
+
+    assert HANDLER_LATENCY.labels("failing_handler").count == handled + 1
+    assert HANDLER_ERRORS.labels("failing_handler").value == failed + 1
+
+
+@pytest.mark.asyncio
+async def test_updates_in_flight_are_counted():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    release = asyncio.Event()
+    before = UPDATES_IN_FLIGHT.labels().value
+
+    update = asyncio.create_task(processor.process_update(user_update(12345), release.wait()))
+    await asyncio.sleep(0.01)
+    assert UPDATES_IN_FLIGHT.labels().value == before + 1
+
+    release.set()
+    await update
+    assert UPDATES_IN_FLIGHT.labels().value == before
+
+
+@pytest.mark.asyncio
+async def test_engine_events_record_queries_and_checkout_waits():
+    engine = create_async_engine(TEST_DB_URL, poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    instrument_engine(engine)
+    selects = DB_QUERY_LATENCY.labels("SELECT").count
+    failed = DB_QUERY_ERRORS.labels("SELECT").value
+    checkouts = DB_POOL_CHECKOUT_WAIT.labels().count
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            with pytest.raises(Exception):
+                await conn.execute(text("SELECT missing_column FROM missing_table"))
+    finally:
+        await engine.dispose()
+
+    assert DB_QUERY_LATENCY.labels("SELECT").count == selects + 1
+    assert DB_QUERY_ERRORS.labels("SELECT").value == failed + 1
+    assert DB_POOL_CHECKOUT_WAIT.labels().count == checkouts + 1
+
+
+@pytest.mark.asyncio
+async def test_llm_latency_and_timeouts_are_recorded():
+    service = YandexGPTBackend(request_timeout=0.05, failure_threshold=5)
+    service.model = AsyncMock()
+
+    async def slow_run(messages):
+        await asyncio.sleep(1)
+    service.model.run.side_effect = slow_run
+    runs = LLM_LATENCY.labels().count
+    timeouts = LLM_ERRORS.labels("timeout").value
+
+    with pytest.raises(asyncio.TimeoutError):
+        await service._run_model([])
+
+    assert LLM_LATENCY.labels().count == runs + 1
+    assert LLM_ERRORS.labels("timeout").value == timeouts + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_served_over_http(unused_tcp_port):
+    server = start_metrics_server(unused_tcp_port)
+    try:
+        response = await tornado.httpclient.AsyncHTTPClient().fetch(f"http://127.0.0.1:{unused_tcp_port}/metrics")
+    finally:
+        server.stop()
+
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b"# TYPE todofrog_updates_in_flight gauge" in response.body
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from src.bot import CreateTaskConversation
+from src.persistence import PostgresPersistence
+from tests.conftest import get_test_session
+
+
+@pytest.fixture
+def persistence_db(mocker):
+    return mocker.patch('src.persistence.get_session', side_effect=get_test_session)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_written_in_one_batch(setup_test_db, persistence_db):
+    persistence = PostgresPersistence()
+
+    await asyncio.gather(
+        persistence.update_conversation("create_task", (1, 1), CreateTaskConversation.DESCRIPTION),
+        persistence.update_conversation("create_task", (2, 2), CreateTaskConversation.DESCRIPTION),
+        persistence.update_user_data(1, {"draft": "Застелить кровать"}),
+        persistence.update_user_data(2, {}),
+    )
+    assert persistence_db.call_count == 1
+
+    restarted = PostgresPersistence()
+    assert await restarted.get_conversations("create_task") == {
+        (1, 1): CreateTaskConversation.DESCRIPTION,
+        (2, 2): CreateTaskConversation.DESCRIPTION,
+    }
+    assert await restarted.get_conversations("other") == {}
+    assert await restarted.get_user_data() == {1: {"draft": "Застелить кровать"}}
+
+
+@pytest.mark.asyncio
+async def test_ended_conversations_and_dropped_data_are_deleted(setup_test_db, persistence_db):
+    persistence = PostgresPersistence()
+    await asyncio.gather(
+        persistence.update_conversation("create_task", (1, 1), CreateTaskConversation.DESCRIPTION),
+        persistence.update_user_data(1, {"draft": "Потянуться"}),
+    )
+
+    await asyncio.gather(
+        persistence.update_conversation("create_task", (1, 1), None),
+        persistence.drop_user_data(1),
+    )
+    await persistence.flush()
+
+    assert await persistence.get_conversations("create_task") == {}
+    assert await persistence.get_user_data() == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_written_with_the_next_one(setup_test_db, persistence_db):
+    persistence = PostgresPersistence()
+    persistence_db.side_effect = [ConnectionError("db is down"), get_test_session()]
+
+    with pytest.raises(ConnectionError):
+        await persistence.update_conversation("create_task", (1, 1), CreateTaskConversation.DESCRIPTION)
+    await persistence.update_conversation("create_task", (2, 2), CreateTaskConversation.DESCRIPTION)
+
+    persistence_db.side_effect = get_test_session
+    assert set(await persistence.get_conversations("create_task")) == {(1, 1), (2, 2)}
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_changes_left_by_a_failed_batch(setup_test_db, persistence_db):
+    persistence = PostgresPersistence()
+    persistence_db.side_effect = [ConnectionError("db is down"), get_test_session()]
+
+    with pytest.raises(ConnectionError):
+        await persistence.update_user_data(1, {"draft": "Потянуться"})
+    await persistence.flush()
+
+    persistence_db.side_effect = get_test_session
+    assert await persistence.get_user_data() == {1: {"draft": "Потянуться"}}
+
+
+@pytest.mark.asyncio
+async def test_empty_data_is_deleted_only_for_stored_users(setup_test_db, persistence_db):
+    await PostgresPersistence().update_user_data(1, {"draft": "Потянуться"})
+
+    persistence = PostgresPersistence()
+    await persistence.get_user_data()
+    persistence_db.reset_mock()
+
+    await persistence.update_user_data(2, {})
+    await persistence.flush()
+    persistence_db.assert_not_called()
+
+    await persistence.update_user_data(1, {})
+    assert await persistence.get_user_data() == {}
+    persistence_db.reset_mock()
+
+    await persistence.update_user_data(1, {})
+    persistence_db.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_writes_are_kept_until_done(setup_test_db, persistence_db):
+    persistence = PostgresPersistence()
+
+    update = asyncio.create_task(persistence.update_user_data(1, {"draft": "Потянуться"}))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert len(persistence._writes) == 1
+
+    await update
+    await asyncio.sleep(0)
+    assert not persistence._writes
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from telegram.error import RetryAfter
+
+from src.metrics import TELEGRAM_ERRORS, TELEGRAM_RATE_LIMIT_WAIT
+from src.rate_limiter import OutboundScheduler, Priority
+
+
+def request(calls: list[str], name: str, error: Exception | None = None):
+    async def callback():
+        if error and name not in calls:
+            calls.append(name)
+            raise error
+        calls.append(name)
+        return True
+    return callback
+
+
+@pytest_asyncio.fixture
+async def scheduler():
+    scheduler = OutboundScheduler(global_rate=20, chat_rate=20, chat_burst=1, max_retries=2)
+    await scheduler.initialize()
+    yield scheduler
+    await scheduler.shutdown()
+
+
+async def process(scheduler, callback, endpoint: str, chat_id: int | None = 1, priority: int | None = None):
+    return await scheduler.process_request(
+        callback=callback,
+        args=(),
+        kwargs={},
+        endpoint=endpoint,
+        data={"chat_id": chat_id},
+        rate_limit_args=priority,
+    )
+
+
+@pytest.mark.asyncio
+async def test_replies_overtake_queued_cleanup(scheduler):
+    scheduler.global_bucket.tokens = 0
+    calls = []
+    reply_waits = TELEGRAM_RATE_LIMIT_WAIT.labels("reply").count
+
+    requests = asyncio.gather(
+        process(scheduler, request(calls, "delete 1"), "deleteMessage"),
+        process(scheduler, request(calls, "delete 2"), "deleteMessage"),
+        process(scheduler, request(calls, "broadcast"), "sendMessage", chat_id=2, priority=Priority.BROADCAST),
+        process(scheduler, request(calls, "answer"), "answerCallbackQuery"),
+    )
+    await asyncio.sleep(0)
+    assert scheduler.queue_depths() == {("reply",): 1, ("default",): 0, ("cleanup",): 2, ("broadcast",): 1}
+    await requests
+
+    assert calls == ["answer", "delete 1", "delete 2", "broadcast"]
+    assert TELEGRAM_RATE_LIMIT_WAIT.labels("reply").count == reply_waits + 1
+    assert sum(scheduler.queue_depths().values()) == 0
+
+
+@pytest.mark.asyncio
+async def test_messages_to_one_chat_are_spread_out(scheduler):
+    calls = []
+    started = time.monotonic()
+
+    await asyncio.gather(*(process(scheduler, request(calls, f"send {i}"), "sendMessage") for i in range(3)))
+    one_chat_time = time.monotonic() - started
+
+    started = time.monotonic()
+    await asyncio.gather(*(process(scheduler, request(calls, f"send to {i}"), "sendMessage", chat_id=10 + i) for i in range(3)))
+    many_chats_time = time.monotonic() - started
+
+    assert calls[:3] == ["send 0", "send 1", "send 2"]
+    assert one_chat_time >= 0.09
+    assert many_chats_time < one_chat_time
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_and_retries(scheduler):
+    calls = []
+    retries = TELEGRAM_ERRORS.labels("sendMessage", "RetryAfter").value
+
+    result = await process(scheduler, request(calls, "send", error=RetryAfter(0)), "sendMessage")
+
+    assert result is True
+    assert calls == ["send", "send"]
+    assert TELEGRAM_ERRORS.labels("sendMessage", "RetryAfter").value == retries + 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_raised_after_max_retries(scheduler):
+    async def always_limited():
+        raise RetryAfter(0)
+
+    retries = TELEGRAM_ERRORS.labels("sendMessage", "RetryAfter").value
+
+    with pytest.raises(RetryAfter):
+        await process(scheduler, always_limited, "sendMessage")
+
+    assert TELEGRAM_ERRORS.labels("sendMessage", "RetryAfter").value == retries + 3
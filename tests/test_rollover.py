@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import delete, select
+
+from src.models import Task, TaskRollover, User
+from src.models.task import TaskStatus
+from src.rollover import get_day_start, roll_over_pending_tasks
+from tests.conftest import get_test_session
+
+
+DAY_START = datetime(2025, 2, 17, tzinfo=timezone.utc)
+YESTERDAY = DAY_START - timedelta(hours=12)
+
+
+@pytest.fixture
+def rollover_db(mocker):
+    mocker.patch('src.rollover.get_session', side_effect=get_test_session)
+
+
+async def _add_tasks(session) -> list[int]:
+    session.add(User(telegram_id=12345))
+    await session.commit()
+    tasks = [
+        Task(user_id=12345, username="test_user", description=f"Task {i}", emoji="🐸", created_at=YESTERDAY, updated_at=YESTERDAY)
+        for i in range(5)
+    ]
+    tasks.append(Task(user_id=12345, username="test_user", description="Done", emoji="🐸", created_at=YESTERDAY, updated_at=YESTERDAY, status=TaskStatus.COMPLETED))
+    tasks.append(Task(user_id=12345, username="test_user", description="Today", emoji="🐸", created_at=DAY_START + timedelta(hours=1), updated_at=DAY_START + timedelta(hours=1)))
+    session.add_all(tasks)
+    await session.commit()
+    return (await session.scalars(select(Task.id).order_by(Task.id))).all()
+
+
+async def _jumps(session) -> dict[str, int]:
+    return dict((await session.execute(select(Task.description, Task.jumps))).all())
+
+
+def test_day_starts_at_rollover_hour():
+    assert get_day_start(datetime(2025, 2, 17, 10, 30), 3) == datetime(2025, 2, 17, 3)
+    assert get_day_start(datetime(2025, 2, 17, 1, 30), 3) == datetime(2025, 2, 16, 3)
+
+
+@pytest.mark.asyncio
+async def test_pending_tasks_jump_once_a_day(setup_test_db, test_session, rollover_db):
+    await _add_tasks(test_session)
+
+    report = await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+
+    assert report.jumped_tasks == 5
+    assert report.chunks == 3
+    assert report.rows_per_second > 0
+    assert await _jumps(test_session) == {**{f"Task {i}": 1 for i in range(5)}, "Done": 0, "Today": 0}
+
+    report = await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+    assert report.jumped_tasks == 0
+    checkpoint = await test_session.get(TaskRollover, DAY_START.date())
+    assert checkpoint.jumped_tasks == 5
+    assert checkpoint.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_jumped_task_does_not_jump_again_without_checkpoint(setup_test_db, test_session, rollover_db):
+    # the test schema has no updated_at trigger, so only the jump itself moves updated_at
+    await _add_tasks(test_session)
+    await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+    await test_session.execute(delete(TaskRollover))
+    await test_session.commit()
+
+    report = await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+
+    assert report.jumped_tasks == 0
+    assert await _jumps(test_session) == {**{f"Task {i}": 1 for i in range(5)}, "Done": 0, "Today": 0}
+
+
+@pytest.mark.asyncio
+async def test_missed_days_are_caught_up(setup_test_db, test_session, rollover_db):
+    test_session.add(User(telegram_id=12345))
+    await test_session.commit()
+    # last jumped three days ago, then the bot was down for two day starts
+    three_days_ago = YESTERDAY - timedelta(days=2)
+    test_session.add(Task(user_id=12345, username="test_user", description="Task", emoji="🐸", created_at=three_days_ago, updated_at=three_days_ago, jumps=1))
+    await test_session.commit()
+
+    report = await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+
+    assert report.jumped_tasks == 1
+    assert await _jumps(test_session) == {"Task": 4}
+
+
+@pytest.mark.asyncio
+async def test_interrupted_rollover_resumes_after_checkpoint(setup_test_db, test_session, rollover_db):
+    task_ids = await _add_tasks(test_session)
+    # a previous run committed the first two tasks and crashed
+    test_session.add(TaskRollover(day=DAY_START.date(), last_task_id=task_ids[1], jumped_tasks=2))
+    await test_session.commit()
+
+    report = await roll_over_pending_tasks(DAY_START, chunk_size=2, pause=0)
+
+    assert report.jumped_tasks == 3
+    jumps = await _jumps(test_session)
+    assert [jumps[f"Task {i}"] for i in range(5)] == [0, 0, 1, 1, 1]
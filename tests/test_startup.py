@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# generous enough for slow CI runners, but catches heavy imports sneaking back in
+IMPORT_TIME_BUDGET_US = 3_000_000
+LAZY_MODULES = ("yandex_cloud_ml_sdk", "grpc", "google.protobuf")
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Runs `python -X importtime` and returns cumulative import time per module in microseconds"""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key.upper() not in ("BOT_TOKEN", "YANDEX_GPT_API_KEY", "YANDEX_CLOUD_FOLDER")
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_bot_import_is_lazy_and_within_budget():
+    times = import_times("src.bot")
+
+    heavy = [name for name in times if name.startswith(LAZY_MODULES)]
+    assert not heavy, f"imported at startup: {heavy}"
+    assert times["src.bot"] < IMPORT_TIME_BUDGET_US
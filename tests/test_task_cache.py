@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from src.metrics import TASK_CACHE_LOOKUPS
+from src.models.task import Task, TaskStatus
+from src.task_cache import PendingTaskCache
+
+
+def _task(task_id: int, emoji: str = "🐸") -> Task:
+    return Task(id=task_id, user_id=1, username="test_user", description=f"Task {task_id}", emoji=emoji, status=TaskStatus.PENDING)
+
+
+@pytest.mark.asyncio
+async def test_tasks_are_loaded_once_and_served_as_copies():
+    cache = PendingTaskCache(max_size=4, ttl=60)
+    loads = 0
+    hits, misses = TASK_CACHE_LOOKUPS.labels("hit").value, TASK_CACHE_LOOKUPS.labels("miss").value
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        return [_task(1), _task(2)]
+
+    first = await cache.get_or_load(1, load)
+    second = await cache.get_or_load(1, load)
+
+    assert loads == 1
+    assert [(task.id, task.emoji, task.status) for task in second] == [(1, "🐸", TaskStatus.PENDING), (2, "🐸", TaskStatus.PENDING)]
+    assert second[0] is not first[0]
+    assert cache.stats == {"hits": 1, "misses": 1, "size": 1}
+    assert TASK_CACHE_LOOKUPS.labels("hit").value == hits + 1
+    assert TASK_CACHE_LOOKUPS.labels("miss").value == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_are_evicted(mocker):
+    cache = PendingTaskCache(max_size=2, ttl=60)
+    monotonic = mocker.patch("src.task_cache.time.monotonic", return_value=0.0)
+
+    async def load():
+        return [_task(1)]
+
+    await cache.get_or_load(1, load)
+    await cache.get_or_load(2, load)
+    await cache.get_or_load(3, load)
+    await cache.get_or_load(2, load)
+    assert cache.misses == 3
+
+    monotonic.return_value = 61.0
+    await cache.get_or_load(2, load)
+    await cache.get_or_load(1, load)
+    assert cache.misses == 5
+
+
+@pytest.mark.asyncio
+async def test_list_loaded_during_invalidation_is_not_cached():
+    cache = PendingTaskCache(max_size=4, ttl=60)
+    loading = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_load():
+        loading.set()
+        await release.wait()
+        return [_task(1, emoji="⏳")]
+
+    read = asyncio.create_task(cache.get_or_load(1, slow_load))
+    await loading.wait()
+    cache.invalidate(1)
+    release.set()
+    await read
+
+    async def load():
+        return [_task(1, emoji="🛏")]
+
+    tasks = await cache.get_or_load(1, load)
+    assert tasks[0].emoji == "🛏"
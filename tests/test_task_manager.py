@@ -0,0 +1,154 @@
+import pytest
+from unittest.mock import AsyncMock
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from src.models import User, Task
+from src.llm_service import EmojiGenerationError
+from src.models.task import TaskStatus
+from src.task_manager import PLACEHOLDER_EMOJI, TaskManager
+from tests.conftest import get_test_session
+
+
+async def _explain(session, statement) -> str:
+    compiled = statement.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True},
+    )
+    result = await session.execute(text(f"EXPLAIN {compiled}"))
+    return "\n".join(row[0] for row in result.all())
+
+
+@pytest.mark.asyncio
+async def test_pending_tasks_lookup_uses_partial_index(setup_test_db, test_session):
+    test_session.add_all([User(telegram_id=user_id) for user_id in range(1, 51)])
+    await test_session.commit()
+
+    test_session.add_all([
+        Task(
+            user_id=user_id,
+            username="test_user",
+            description=f"Task {i}",
+            emoji="🐸",
+            status=TaskStatus.COMPLETED if i % 4 else TaskStatus.PENDING,
+        )
+        for user_id in range(1, 51)
+        for i in range(20)
+    ])
+    await test_session.commit()
+    await test_session.execute(text("ANALYZE tasks"))
+    # the table is tiny, so make the planner prove the index is usable at all
+    await test_session.execute(text("SET enable_seqscan = off"))
+
+    plan = await _explain(
+        test_session,
+        select(Task)
+        .where(Task.user_id == 7)
+        .where(Task.status == TaskStatus.PENDING),
+    )
+
+    assert "ix_tasks_user_id_pending" in plan
+
+
+@pytest.mark.asyncio
+async def test_fill_task_emoji_replaces_placeholder(setup_test_db, test_session, mocker):
+    llm_service_mock = AsyncMock()
+    llm_service_mock.suggest_local_emoji.return_value = None
+    llm_service_mock.generate_task_emoji.side_effect = ["🛏", EmojiGenerationError("YandexGPT is unavailable")]
+    llm_service_mock.fallback_emoji = "🐸"
+    mocker.patch('src.task_manager.llm_service', llm_service_mock)
+
+    test_session.add(User(telegram_id=12345))
+    await test_session.commit()
+
+    task_manager = TaskManager(test_session)
+    first_id = await task_manager.create_task(12345, "test_user", "Застелить кровать", emoji=PLACEHOLDER_EMOJI)
+    second_id = await task_manager.create_task(12345, "test_user", "Потянуться", emoji=PLACEHOLDER_EMOJI)
+    llm_service_mock.generate_task_emoji.assert_not_called()
+
+    assert await task_manager.fill_task_emoji(first_id, "Застелить кровать") == "🛏"
+    assert await task_manager.fill_task_emoji(second_id, "Потянуться") == "🐸"
+
+    tasks = {task.id: task for task in await task_manager.get_pending_user_tasks(12345)}
+    assert tasks[first_id].emoji == "🛏"
+    assert tasks[second_id].emoji == "🐸"
+
+
+@pytest.mark.asyncio
+async def test_database_errors_are_not_replaced_with_fallback_emoji(test_session, mocker):
+    llm_service_mock = AsyncMock()
+    llm_service_mock.suggest_local_emoji.return_value = None
+    llm_service_mock.fallback_emoji = "🐸"
+    mocker.patch('src.task_manager.llm_service', llm_service_mock)
+    emoji_cache_mock = AsyncMock()
+    emoji_cache_mock.get_or_generate.side_effect = DBAPIError("SELECT", {}, Exception("connection is closed"))
+    mocker.patch('src.task_manager.emoji_cache', emoji_cache_mock)
+
+    with pytest.raises(DBAPIError):
+        await TaskManager(test_session).create_task(12345, "test_user", "Застелить кровать")
+
+
+@pytest.mark.asyncio
+async def test_first_task_of_a_new_user_creates_the_user(setup_test_db, test_session):
+    task_manager = TaskManager(test_session)
+    await task_manager.create_task(12345, "test_user", "Застелить кровать", emoji="🛏")
+    await task_manager.create_task(12345, "test_user", "Потянуться", emoji="🧘")
+
+    assert await test_session.get(User, 12345) is not None
+    assert await task_manager.get_task_count(12345) == 2
+
+
+@pytest.mark.asyncio
+async def test_pending_tasks_are_cached_until_changed(setup_test_db, test_session, mocker):
+    test_session.add(User(telegram_id=12345))
+    test_session.add(Task(user_id=12345, username="test_user", description="Task 1", emoji="🐸"))
+    await test_session.commit()
+
+    async with get_test_session() as session:
+        task_manager = TaskManager(session)
+        execute = mocker.spy(session, "execute")
+        tasks = await task_manager.get_pending_user_tasks(12345)
+        assert await task_manager.get_task_count(12345) == 1
+        assert [task.description for task in await task_manager.get_pending_user_tasks(12345)] == ["Task 1"]
+        assert execute.call_count == 1
+
+    async with get_test_session() as session:
+        task_manager = TaskManager(session)
+        await task_manager.create_task(12345, "test_user", "Task 2", emoji="🐸")
+        # read back within the writing session, straight from the database
+        assert await task_manager.get_task_count(12345) == 2
+        await task_manager.change_task_status(tasks[0].id, "complete", 12345)
+
+    async with get_test_session() as session:
+        task_manager = TaskManager(session)
+        assert [task.description for task in await task_manager.get_pending_user_tasks(12345)] == ["Task 2"]
+
+
+@pytest.mark.asyncio
+async def test_change_task_status_checks_owner_in_one_statement(setup_test_db, test_session, mocker):
+    test_session.add_all([User(telegram_id=12345), User(telegram_id=54321)])
+    await test_session.commit()
+    test_session.add_all([
+        Task(user_id=12345, username="test_user", description=f"Task {i}", emoji="🐸")
+        for i in range(3)
+    ])
+    await test_session.commit()
+    first, second, third = (await test_session.scalars(select(Task).order_by(Task.id))).all()
+
+    async with get_test_session() as session:
+        task_manager = TaskManager(session)
+        execute = mocker.spy(session, "execute")
+
+        assert await task_manager.change_task_status(first.id, "complete", 54321) is None
+        remaining = await task_manager.change_task_status(first.id, "complete", 12345)
+        assert sorted(task.id for task in remaining) == [second.id, third.id]
+        assert await task_manager.change_task_status(first.id, "delete", 12345) is None
+        remaining = await task_manager.change_task_status(second.id, "delete", 12345)
+        assert [task.id for task in remaining] == [third.id]
+        assert await task_manager.change_task_status(third.id, "complete", 12345) == []
+        assert execute.call_count == 5
+
+    statuses = dict((await test_session.execute(select(Task.id, Task.status))).all())
+    assert statuses == {first.id: TaskStatus.COMPLETED, third.id: TaskStatus.COMPLETED}
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock
+from telegram import Update
+
+from src.update_processor import PerUserUpdateProcessor
+
+
+def user_update(user_id: int) -> Update:
+    update = MagicMock(spec=Update)
+    update.effective_user.id = user_id
+    return update
+
+
+async def handle(events: list[str], name: str, delay: float = 0.02) -> None:
+    events.append(f"start {name}")
+    await asyncio.sleep(delay)
+    events.append(f"end {name}")
+
+
+@pytest.mark.asyncio
+async def test_updates_of_one_user_are_serialized():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    events = []
+
+    await asyncio.gather(
+        processor.process_update(user_update(1), handle(events, "first tap")),
+        processor.process_update(user_update(1), handle(events, "second tap")),
+        processor.process_update(user_update(2), handle(events, "other user")),
+    )
+
+    assert events.index("end first tap") < events.index("start second tap")
+    assert events.index("start other user") < events.index("end first tap")
+    assert not processor._user_locks
+
+
+@pytest.mark.asyncio
+async def test_waiting_updates_of_one_user_do_not_take_slots():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    events = []
+
+    await asyncio.gather(
+        *(processor.process_update(user_update(1), handle(events, f"tap {i}")) for i in range(3)),
+        processor.process_update(user_update(2), handle(events, "other user")),
+    )
+
+    # the second slot stays free for another user while user 1 taps repeatedly
+    assert events.index("start other user") < events.index("end tap 0")
+
+
+@pytest.mark.asyncio
+async def test_limit_is_respected():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    processor.limit = 3
+    running = 0
+    max_running = 0
+
+    async def track():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(processor.process_update(user_update(i), track()) for i in range(10)))
+
+    assert max_running == 3
+
+
+def test_limit_adapts_to_loop_lag_and_pool_usage():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=32, min_concurrent_updates=4, max_loop_lag=0.1)
+
+    assert processor.adjust_limit(loop_lag=0.5, pool_usage=0.2) == 16
+    assert processor.adjust_limit(loop_lag=0.0, pool_usage=1.0) == 8
+    assert processor.adjust_limit(loop_lag=0.0, pool_usage=0.5) == 9
+    for _ in range(5):
+        processor.adjust_limit(loop_lag=0.5, pool_usage=0.0)
+    assert processor.limit == 4
+    for _ in range(100):
+        processor.adjust_limit(loop_lag=0.0, pool_usage=0.0)
+    assert processor.limit == 32
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from src import user_manager
+from src.models import User
+from src.user_manager import get_list_message_id, update_user_list_message_id
+from tests.conftest import get_test_session
+
+
+@pytest.fixture
+def flush_to_test_db(mocker):
+    mocker.patch('src.user_manager.get_session', side_effect=get_test_session)
+
+
+@pytest.mark.asyncio
+async def test_new_user_is_written_right_away(setup_test_db, test_session):
+    await update_user_list_message_id(test_session, None, 1, 10)
+
+    user = await test_session.get(User, 1)
+    assert user.list_message_id == 11
+
+
+@pytest.mark.asyncio
+async def test_update_is_buffered_until_flush(setup_test_db, test_session, flush_to_test_db):
+    test_session.add(User(telegram_id=1, list_message_id=10))
+    await test_session.commit()
+    user = await test_session.get(User, 1)
+
+    await update_user_list_message_id(test_session, user, 1, 20)
+    await update_user_list_message_id(test_session, user, 1, 30)
+
+    assert get_list_message_id(user) == 30
+    await test_session.refresh(user)
+    assert user.list_message_id == 10
+
+    assert await user_manager.list_message_ids.flush() == 1
+    await test_session.refresh(user)
+    assert user.list_message_id == 30
+    assert get_list_message_id(user) == 30
+
+
+@pytest.mark.asyncio
+async def test_flush_upserts_all_users_at_once(setup_test_db, test_session, flush_to_test_db):
+    test_session.add(User(telegram_id=1, list_message_id=10, blocked_at=datetime(2025, 2, 1, tzinfo=timezone.utc)))
+    await test_session.commit()
+
+    user_manager.list_message_ids.set(1, 11)
+    user_manager.list_message_ids.set(2, 21)
+    await user_manager.list_message_ids.stop()
+
+    users = (await test_session.scalars(select(User).order_by(User.telegram_id))).all()
+    assert [(user.telegram_id, user.list_message_id) for user in users] == [(1, 11), (2, 21)]
+    # opening the list means the bot is no longer blocked
+    assert users[0].blocked_at is None
+    assert await user_manager.list_message_ids.flush() == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_newer_values(mocker):
+    buffer = user_manager.ListMessageIdBuffer()
+    buffer.set(1, 10)
+    buffer.set(2, 20)
+
+    async def failing_execute(*args, **kwargs):
+        buffer.set(1, 11)
+        raise ConnectionError("db is down")
+
+    session = mocker.AsyncMock()
+    session.execute.side_effect = failing_execute
+    session_context = mocker.MagicMock()
+    session_context.__aenter__ = mocker.AsyncMock(return_value=session)
+    session_context.__aexit__ = mocker.AsyncMock(return_value=False)
+    mocker.patch('src.user_manager.get_session', return_value=session_context)
+
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+
+    assert buffer.get(1) == 11
+    assert buffer.get(2) == 20
+
+
+@pytest.mark.asyncio
+async def test_values_being_flushed_are_still_read(mocker):
+    buffer = user_manager.ListMessageIdBuffer()
+    buffer.set(1, 10)
+    read_while_writing = []
+    writing = asyncio.Event()
+
+    async def stalled_execute(*args, **kwargs):
+        read_while_writing.append(buffer.get(1, default=5))
+        writing.set()
+        await asyncio.Event().wait()
+
+    session = mocker.AsyncMock()
+    session.execute.side_effect = stalled_execute
+    session_context = mocker.MagicMock()
+    session_context.__aenter__ = mocker.AsyncMock(return_value=session)
+    session_context.__aexit__ = mocker.AsyncMock(return_value=False)
+    mocker.patch('src.user_manager.get_session', return_value=session_context)
+
+    flush = asyncio.create_task(buffer.flush())
+    await writing.wait()
+    # a stop() cancels the periodic flush in the middle of its write
+    flush.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flush
+
+    assert read_while_writing == [10]
+    assert buffer.get(1, default=5) == 10
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from src.utils import SideEffectSkipped, SideEffects
+
+
+async def record(events: list[str], name: str, delay: float = 0.0, error: Exception | None = None) -> str:
+    events.append(f"start {name}")
+    await asyncio.sleep(delay)
+    if error:
+        raise error
+    events.append(f"end {name}")
+    return name
+
+
+@pytest.mark.asyncio
+async def test_independent_side_effects_run_concurrently():
+    events = []
+    started = time.monotonic()
+
+    async with SideEffects() as effects:
+        first = effects.add(record(events, "send", 0.1))
+        effects.add(record(events, "delete", 0.1))
+        effects.add(record(events, "answer", 0.1))
+
+    assert time.monotonic() - started < 0.25
+    assert first.result() == "send"
+    assert not effects.errors
+
+
+@pytest.mark.asyncio
+async def test_side_effects_with_same_key_keep_order():
+    events = []
+
+    async with SideEffects() as effects:
+        effects.add(record(events, "send", 0.05), key=1)
+        effects.add(record(events, "delete", 0.0), key=1)
+        effects.add(record(events, "other chat", 0.0), key=2)
+
+    assert events.index("end send") < events.index("start delete")
+    assert events.index("start other chat") < events.index("end send")
+
+
+@pytest.mark.asyncio
+async def test_failures_are_reported_one_by_one():
+    events = []
+
+    async with SideEffects() as effects:
+        effects.add(record(events, "send", error=RuntimeError("send failed")), key=1)
+        effects.add(record(events, "delete old list"), key=1)
+        effects.add(record(events, "delete command", error=RuntimeError("delete failed")))
+        effects.add(record(events, "answer"))
+
+    assert "start delete old list" not in events
+    assert "end answer" in events
+    assert [type(error) for error in effects.errors] == [RuntimeError, SideEffectSkipped, RuntimeError]
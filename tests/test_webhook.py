@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import MagicMock
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+import tornado.web
+
+from src.settings import Settings
+from src.webhook import (
+    SECRET_TOKEN_HEADER,
+    WEBHOOK_PATH,
+    ReceiverHandler,
+    WorkerHandler,
+    WorkerRouter,
+    get_update_user_id,
+    get_worker_environment,
+    get_worker_index,
+    wait_for_ports,
+)
+
+
+def _message(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "chat": {"id": user_id, "type": "private"},
+            "text": f"update {update_id}",
+        },
+    }
+
+
+def test_updates_are_routed_by_user():
+    callback_query = {"update_id": 2, "callback_query": {"id": "1", "from": {"id": 7}, "chat_instance": "1"}}
+    poll_answer = {"update_id": 3, "poll_answer": {"poll_id": "1", "user": {"id": 8}, "option_ids": []}}
+    channel_post = {"update_id": 4, "channel_post": {"message_id": 1, "date": 0, "chat": {"id": -100, "type": "channel"}}}
+
+    assert get_update_user_id(_message(1, 5)) == 5
+    assert get_update_user_id(callback_query) == 7
+    assert get_update_user_id(poll_answer) == 8
+    assert get_worker_index(channel_post, 3) == -100 % 3
+    assert get_worker_index({"update_id": 5}, 3) == 0
+    assert {get_worker_index(_message(i, 5), 3) for i in range(10)} == {2}
+
+
+def test_limits_are_split_between_workers():
+    settings = Settings(db_pool_size=5, db_max_overflow=10, rate_limit_global_per_second=30.0, broadcast_rate=20.0)
+
+    assert get_worker_environment(settings, 4) == {
+        "DB_POOL_SIZE": "2",
+        "DB_MAX_OVERFLOW": "3",
+        "RATE_LIMIT_GLOBAL_PER_SECOND": "7.5",
+        "BROADCAST_RATE": "5.0",
+    }
+
+
+def _serve(handlers) -> int:
+    sock, port = tornado.testing.bind_unused_port()
+    server = tornado.httpserver.HTTPServer(tornado.web.Application(handlers))
+    server.add_sockets([sock])
+    return port
+
+
+class RecordingWorker(tornado.web.RequestHandler):
+    def initialize(self, received: list) -> None:
+        self.received = received
+
+    async def post(self) -> None:
+        self.received.append(json.loads(self.request.body)["update_id"])
+
+
+@pytest.mark.asyncio
+async def test_receiver_forwards_updates_to_the_users_worker():
+    received = [[], []]
+    worker_ports = [_serve([(WEBHOOK_PATH, RecordingWorker, {"received": worker})]) for worker in received]
+    port = _serve([(WEBHOOK_PATH, ReceiverHandler, {"router": WorkerRouter(worker_ports), "secret_token": "secret"})])
+    client = tornado.httpclient.AsyncHTTPClient()
+
+    async def post(update: dict, token: str = "secret"):
+        return await client.fetch(
+            f"http://127.0.0.1:{port}{WEBHOOK_PATH}",
+            method="POST",
+            body=json.dumps(update),
+            headers={SECRET_TOKEN_HEADER: token},
+            raise_error=False,
+        )
+
+    responses = await asyncio.gather(*(post(_message(update_id, user_id)) for update_id, user_id in enumerate([2, 3, 4, 5, 2])))
+    assert [response.code for response in responses] == [200] * 5
+    assert sorted(received[0]) == [0, 2, 4]
+    assert sorted(received[1]) == [1, 3]
+
+    assert (await post(_message(5, 2), token="wrong")).code == 403
+    assert len(received[0]) == 3
+
+
+@pytest.mark.asyncio
+async def test_worker_queues_forwarded_updates():
+    app = MagicMock(bot=None, update_queue=asyncio.Queue())
+    port = _serve([(WEBHOOK_PATH, WorkerHandler, {"app": app})])
+
+    await tornado.httpclient.AsyncHTTPClient().fetch(
+        f"http://127.0.0.1:{port}{WEBHOOK_PATH}",
+        method="POST",
+        body=json.dumps(_message(1, 5)),
+    )
+
+    update = app.update_queue.get_nowait()
+    assert update.update_id == 1
+    assert update.effective_user.id == 5
+
+
+@pytest.mark.asyncio
+async def test_receiver_waits_for_workers_to_listen():
+    sock, port = tornado.testing.bind_unused_port()
+    sock.close()
+
+    waiting = asyncio.create_task(wait_for_ports([port], timeout=5, interval=0.01))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([]))
+    server.listen(port, "127.0.0.1")
+    try:
+        await waiting
+    finally:
+        server.stop()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await wait_for_ports([port], timeout=0.05, interval=0.01)